@@ -0,0 +1,119 @@
+# .pls playlist reading and writing, shared by playlist-generator and
+# playlist-recomposer.
+#
+# Entries are streamed straight to disk, so memory use doesn't grow with
+# playlist length, and the output is byte for byte what ConfigParser
+# wrote, less the superfluous final blank line that makes kodi ignore a
+# playlist (https://bugs.python.org/issue32917).
+
+import os
+
+# kodi ignores playlists larger than this
+KODI_MAX_FILE_LENGTH = 1048576
+
+HEADER = "[playlist]"
+VERSION = 2
+
+
+def format_value(value):
+    # as ConfigParser, indent continuation lines of multiline values
+    return f"{value}".replace("\n", "\n\t")
+
+
+def write_entries(f, entries, newline=os.linesep):
+    # writes a complete playlist to a text file opened with newline="",
+    # entries being (file, title, length) tuples, and returns the number
+    # of entries written
+    f.write(f"{HEADER}{newline}")
+    n = 0
+    for n, (file, title, length) in enumerate(entries, start=1):
+        f.write(format_entry(n, file, title, length, newline))
+    f.write(format_trailer(n, newline))
+    return n
+
+
+def format_entry(n, file, title, length, newline=os.linesep):
+    return (
+        f"File{n}={format_value(file)}{newline}"
+        f"Title{n}={format_value(title)}{newline}"
+        f"Length{n}={format_value(length)}{newline}"
+    )
+
+
+def format_trailer(n, newline=os.linesep):
+    return f"NumberOfEntries={n}{newline}Version={VERSION}{newline}"
+
+
+# latin-1 encodes one byte per character, so these are file sizes
+
+
+def entry_length(n, file, title, length, newline=os.linesep):
+    # bytes taken by entry n
+    return len(format_entry(n, file, title, length, newline))
+
+
+def envelope_length(n, newline=os.linesep):
+    # bytes taken by the header and trailer of an n entry playlist
+    return len(f"{HEADER}{newline}") + len(format_trailer(n, newline))
+
+
+def same_contents(fn1, fn2, bufsize=65536):
+    try:
+        with open(fn1, mode="rb") as f1, open(fn2, mode="rb") as f2:
+            if os.fstat(f1.fileno()).st_size != os.fstat(f2.fileno()).st_size:
+                return False
+            while True:
+                b1 = f1.read(bufsize)
+                if b1 != f2.read(bufsize):
+                    return False
+                if not b1:
+                    return True
+    except FileNotFoundError:
+        return False
+
+
+def write_playlist(fn, entries, newline=os.linesep):
+    # writes to a temporary file alongside fn, then either renames it over
+    # fn or, if fn already has the same contents, discards it, so readers
+    # never see a partial playlist and an unchanged playlist keeps its
+    # mtime. Returns True if fn was written.
+    head, tail = os.path.split(fn)
+    tmp = os.path.join(head, f".{tail}.{os.getpid()}.tmp")
+    # 0o666 so the new playlist gets the usual umask permissions
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with open(fd, mode="w", encoding="latin-1", newline="") as f:
+            write_entries(f, entries, newline)
+        if same_contents(tmp, fn):
+            os.remove(tmp)
+            return False
+        os.replace(tmp, fn)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+
+def read_entries(f):
+    # reads (file, title, length) tuples from a playlist's lines,
+    # looking up keys case insensitively, as ConfigParser
+    values = {}
+    for line in f:
+        key, delimiter, value = line.partition("=")
+        if delimiter:
+            values[key.strip().lower()] = value.strip()
+    n = int(values.get("numberofentries", 0))
+    return [
+        (
+            values.get(f"file{i}", ""),
+            values.get(f"title{i}", ""),
+            values.get(f"length{i}", ""),
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def read_playlist(fn):
+    with open(fn, encoding="latin-1") as f:
+        return read_entries(f)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+# Benchmarks playlist-generator over a synthetic library.
+#
+# The library is made of tiny mediafiles with valid mp3 (Xing) or FLAC
+# (STREAMINFO) headers, so durations are read from headers, and .txt
+# sidecars of a given size. The walk, probe, sort and write phases are
+# timed separately, each repeated, and the best time kept. Results are
+# printed as JSON so that runs can be compared.
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+spec = importlib.util.spec_from_file_location(
+    "playlist_generator",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "playlist-generator.py"
+    ),
+)
+playlist_generator = importlib.util.module_from_spec(spec)
+# registered so that a process pool can pickle its probes
+sys.modules[spec.name] = playlist_generator
+spec.loader.exec_module(playlist_generator)
+PlaylistGenerator = playlist_generator.PlaylistGenerator
+TreeWalker = playlist_generator.TreeWalker
+
+# MPEG-1 layer III, 128 kbps, 44.1 kHz, joint stereo
+MP3_HEADER = b"\xff\xfb\x90\x44"
+MP3_FRAME_LENGTH = 417
+MP3_SIDE_INFO = 32
+
+WORDS = (
+    "Symphony Concerto Sonata Quartet Suite Overture Variations Mass "
+    "Requiem Prelude Fugue Nocturne Allegro Adagio Andante Presto "
+    "Orchestra Philharmonic Chamber Choir Soloists Conductor Piano "
+    "Violin Cello Horn Live Recorded Hall Festival"
+).split()
+
+
+def mp3_bytes(seconds):
+    frames = round(seconds * 44100 / 1152)
+    frame = bytearray(MP3_FRAME_LENGTH)
+    frame[:4] = MP3_HEADER
+    xing = 4 + MP3_SIDE_INFO
+    frame[xing : xing + 12] = b"Xing" + struct.pack(  # noqa: E203
+        ">II", 0x01, frames
+    )
+    # a second frame header so the first frame's sync is verified
+    return bytes(frame) + MP3_HEADER + bytes(MP3_FRAME_LENGTH - 4)
+
+
+def flac_bytes(seconds):
+    sample_rate = 44100
+    streaminfo = struct.pack(">HH3s3s", 4096, 4096, bytes(3), bytes(3))
+    streaminfo += (
+        sample_rate << 44 | 1 << 41 | 15 << 36 | round(seconds * sample_rate)
+    ).to_bytes(8, "big")
+    streaminfo += bytes(16)
+    return b"fLaC" + b"\x80" + len(streaminfo).to_bytes(3, "big") + streaminfo
+
+
+def sidecar_text(rng, size):
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)[:size]
+
+
+def build_library(root, stations, files, sidecar_size, seed=0):
+    # returns (sources folder, playlists folder, number of mediafiles)
+    rng = random.Random(seed)
+    sources_dir = f"{root}/Stations"
+    playlists_dir = f"{root}/Playlists"
+    os.makedirs(playlists_dir, exist_ok=True)
+    now = time.time()
+    n = 0
+    for s in range(stations):
+        station_dir = f"{sources_dir}/Station {s:03d}"
+        os.makedirs(station_dir, exist_ok=True)
+        for i in range(files):
+            seconds = rng.uniform(600, 10800)
+            if rng.random() < 0.8:
+                suffix, data = ".mp3", mp3_bytes(seconds)
+            else:
+                suffix, data = ".flac", flac_bytes(seconds)
+            stem = f"{station_dir}/broadcast-{i:05d}"
+            with open(f"{stem}{suffix}", mode="wb") as f:
+                f.write(data)
+            if sidecar_size:
+                with open(f"{stem}.txt", mode="w", encoding="latin-1") as f:
+                    f.write(sidecar_text(rng, sidecar_size))
+            # spread recordings over a few years, in no particular order
+            mtime = now - rng.uniform(0, 3 * 365 * 86400)
+            os.utime(f"{stem}{suffix}", (mtime, mtime))
+            n += 1
+    return sources_dir, playlists_dir, n
+
+
+def run_phases(sources_dir, playlists_dir, options):
+    # one pass through the phases generate_playlists goes through,
+    # returns their times in seconds and the walker's counters
+    times = {}
+    start = time.perf_counter()
+    walker = TreeWalker(options.workers)
+    scanned = []
+    for dir, _, files in walker.walk(sources_dir):
+        media = PlaylistGenerator._scan_folder(
+            dir, files, walker, None, None, options
+        )
+        if media != []:
+            scanned.append((dir, media))
+    times["walk"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    executor = PlaylistGenerator._create_executor(options)
+    try:
+        if executor:
+            scanned = [
+                (
+                    dir,
+                    [
+                        m[:4]
+                        + (
+                            executor.submit(
+                                PlaylistGenerator._probe_media,
+                                m[0],
+                                m[1],
+                                options.fast_probe,
+                            ),
+                        )
+                        + m[5:]
+                        for m in media
+                    ],
+                )
+                for dir, media in scanned
+            ]
+        quarantined = []
+        resolved = [
+            (
+                dir,
+                PlaylistGenerator._resolve_probes(
+                    media, None, options, quarantined
+                ),
+            )
+            for dir, media in scanned
+        ]
+    finally:
+        if executor:
+            executor.shutdown()
+    times["probe"] = time.perf_counter() - start
+    # every synthetic mediafile has a valid header, so a failed probe
+    # would only time the failure
+    if quarantined:
+        f_fqp, reason = quarantined[0]
+        raise RuntimeError(
+            f"{len(quarantined)} probes failed, {f_fqp}: {reason}"
+        )
+    for dir, media in resolved:
+        for f_fqp, _, length, _ in media:
+            if length == "0":
+                raise RuntimeError(f"{f_fqp} probed with no length")
+
+    start = time.perf_counter()
+    stations = [
+        (
+            dir,
+            PlaylistGenerator._sorted_media_list(
+                playlists_dir, sources_dir, media
+            ),
+        )
+        for dir, media in resolved
+    ]
+    times["sort"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for dir, media_list in stations:
+        PlaylistGenerator._write_station(
+            playlists_dir, sources_dir, dir, media_list, options
+        )
+    times["write"] = time.perf_counter() - start
+    return times, walker.listings, walker.stat_calls
+
+
+def clear_playlists(playlists_dir):
+    # so that every write phase writes, rather than finds playlists
+    # unchanged
+    for fn in os.listdir(playlists_dir):
+        os.remove(os.path.join(playlists_dir, fn))
+
+
+def benchmark(sources_dir, playlists_dir, n, options, repeat, trace):
+    best = {}
+    peaks = {}
+    for _ in range(repeat):
+        clear_playlists(playlists_dir)
+        if trace:
+            tracemalloc.start()
+        times, listings, stat_calls = run_phases(
+            sources_dir, playlists_dir, options
+        )
+        if trace:
+            peaks["python_peak_bytes"] = max(
+                peaks.get("python_peak_bytes", 0),
+                tracemalloc.get_traced_memory()[1],
+            )
+            tracemalloc.stop()
+        for phase, t in times.items():
+            best[phase] = min(best.get(phase, t), t)
+    # the complete, unmodified code path, for comparison with the sum
+    # of the phases
+    total = None
+    for _ in range(repeat):
+        clear_playlists(playlists_dir)
+        start = time.perf_counter()
+        PlaylistGenerator.generate_playlists(
+            playlists_dir, sources_dir, options=options
+        )
+        t = time.perf_counter() - start
+        total = t if total is None else min(total, t)
+    phases = {
+        phase: {
+            "seconds": round(t, 6),
+            "files_per_second": round(n / t) if t > 0 else None,
+        }
+        for phase, t in best.items()
+    }
+    phases["generate_playlists"] = {
+        "seconds": round(total, 6),
+        "files_per_second": round(n / total) if total > 0 else None,
+    }
+    memory = dict(peaks)
+    if resource:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        if sys.platform != "darwin":
+            maxrss *= 1024
+        memory["maxrss_bytes"] = maxrss
+    return {
+        "phases": phases,
+        "folders_listed": listings,
+        "stat_calls": stat_calls,
+        "memory": memory,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "benchmark",
+        description="Benchmark playlist-generator over a synthetic library",
+    )
+    parser.add_argument(
+        "--stations", type=int, default=20, help="number of stations"
+    )
+    parser.add_argument(
+        "--files", type=int, default=500, help="mediafiles per station"
+    )
+    parser.add_argument(
+        "--sidecar-size",
+        type=int,
+        default=1500,
+        help="bytes per .txt sidecar, 0 for none (default: 1500)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of concurrent mediafile probes (default: 1)",
+    )
+    parser.add_argument(
+        "--pool",
+        choices=("thread", "process"),
+        default="thread",
+        help="probe with a pool of threads or processes (default: thread)",
+    )
+    parser.add_argument(
+        "--no-fast-probe",
+        action="store_true",
+        help="probe every mediafile with MediaInfo",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per phase, the best is reported (default: 3)",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="also report peak Python allocations (slows the phases)",
+    )
+    parser.add_argument(
+        "--dir",
+        help="build the library here and keep it (default: a temporary "
+        "folder)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    args = parser.parse_args()
+    options = PlaylistGenerator.Options(
+        workers=args.workers,
+        pool=args.pool,
+        fast_probe=not args.no_fast_probe,
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.abspath(args.dir or tmp).replace(os.sep, "/")
+        start = time.perf_counter()
+        sources_dir, playlists_dir, n = build_library(
+            root, args.stations, args.files, args.sidecar_size, args.seed
+        )
+        build_time = time.perf_counter() - start
+        results = {
+            "library": {
+                "stations": args.stations,
+                "files": n,
+                "sidecar_size": args.sidecar_size,
+                "seed": args.seed,
+                "build_seconds": round(build_time, 3),
+            },
+            "options": {
+                "workers": args.workers,
+                "pool": args.pool,
+                "fast_probe": options.fast_probe,
+                "repeat": args.repeat,
+            },
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        }
+        results.update(
+            benchmark(
+                sources_dir,
+                playlists_dir,
+                n,
+                options,
+                args.repeat,
+                args.tracemalloc,
+            )
+        )
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, mode="w") as f:
+            f.write(f"{output}\n")
+    print(output)
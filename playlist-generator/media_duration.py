@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+# Mediafile durations read directly from container headers.
+#
+# Each reader looks at no more than a few KB at the start (and for Ogg,
+# the end) of a file and returns the duration in milliseconds, or None
+# when the file is in a layout it doesn't understand, e.g. free format
+# mp3, ADTS aac or FLAC in Ogg. Callers should then fall back to
+# MediaInfo.
+
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+import uuid
+
+HEAD_LENGTH = 65536
+TAIL_LENGTH = 65536
+
+MPEG_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384,
+             416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320,
+             384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256,
+             320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224,
+             256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}  # fmt: skip
+
+MPEG_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+
+ASF_HEADER = uuid.UUID("75B22630-668E-11CF-A6D9-00AA0062CE6C").bytes_le
+ASF_FILE_PROPERTIES = uuid.UUID(
+    "8CABDCA1-A947-11CF-8EE4-00C00C205365"
+).bytes_le
+
+
+def skip_id3v2(f):
+    # returns the offset of the first byte after any ID3v2 tags
+    offset = 0
+    while True:
+        f.seek(offset)
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b"ID3":
+            return offset
+        size = 0
+        for b in header[6:10]:
+            size = (size << 7) | (b & 0x7F)
+        offset += 10 + size
+        if header[5] & 0x10:
+            offset += 10
+
+
+def parse_mpeg_header(header):
+    # returns (version, layer, bitrate kbps, sample rate, padding, mono)
+    # for a valid mpeg audio frame header, otherwise None
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (2.5, None, 2, 1)[(header[1] >> 3) & 0x03]
+    layer = (None, 3, 2, 1)[(header[1] >> 1) & 0x03]
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if (
+        version is None
+        or layer is None
+        or bitrate_index in (0, 15)
+        or sample_rate_index == 3
+    ):
+        return None
+    bitrate = MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    mono = header[3] >> 6 == 0x03
+    return version, layer, bitrate, sample_rate, padding, mono
+
+
+def mpeg_frame_length(version, layer, bitrate, sample_rate, padding):
+    if layer == 1:
+        return (12000 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != 1:
+        return 72000 * bitrate // sample_rate + padding
+    else:
+        return 144000 * bitrate // sample_rate + padding
+
+
+def mpeg_samples_per_frame(version, layer):
+    if layer == 1:
+        return 384
+    elif layer == 3 and version != 1:
+        return 576
+    else:
+        return 1152
+
+
+def mpeg_duration(f, size):
+    start = skip_id3v2(f)
+    f.seek(start)
+    head = f.read(HEAD_LENGTH)
+    i = head.find(b"\xff")
+    while 0 <= i < len(head) - 4:
+        header = parse_mpeg_header(head[i : i + 4])  # noqa: E203
+        if header:
+            length = mpeg_frame_length(*header[:5])
+            # guard against a false sync by checking the next frame
+            next_header = head[i + length : i + length + 4]  # noqa: E203
+            if parse_mpeg_header(next_header) or (
+                len(next_header) < 4 and i == 0
+            ):
+                break
+        i = head.find(b"\xff", i + 1)
+    else:
+        return None
+    version, layer, bitrate, sample_rate, _, mono = header
+    samples = mpeg_samples_per_frame(version, layer)
+    frame = head[i:]
+    if layer == 3:
+        if version == 1:
+            side_info = 17 if mono else 32
+        else:
+            side_info = 9 if mono else 17
+        xing = frame[4 + side_info : 12 + side_info]  # noqa: E203
+        if xing[:4] in (b"Xing", b"Info"):
+            flags = struct.unpack(">I", xing[4:8])[0]
+            if flags & 0x01:
+                frames = struct.unpack_from(">I", frame, 12 + side_info)[0]
+                return frames * samples * 1000 / sample_rate
+        if frame[36:40] == b"VBRI":
+            frames = struct.unpack(">I", frame[50:54])[0]
+            return frames * samples * 1000 / sample_rate
+    # constant bitrate
+    audio_length = size - start - i
+    if size >= 128:
+        f.seek(size - 128)
+        if f.read(3) == b"TAG":
+            audio_length -= 128
+    return audio_length * 8 / bitrate
+
+
+def flac_duration(f, size):
+    f.seek(skip_id3v2(f))
+    head = f.read(42)
+    if head[:4] != b"fLaC" or head[4] & 0x7F != 0:
+        return None
+    streaminfo = head[8:42]
+    sample_rate = (
+        streaminfo[10] << 12 | streaminfo[11] << 4 | streaminfo[12] >> 4
+    )
+    total_samples = (streaminfo[13] & 0x0F) << 32 | struct.unpack(
+        ">I", streaminfo[14:18]
+    )[0]
+    if sample_rate == 0 or total_samples == 0:
+        return None
+    return total_samples * 1000 / sample_rate
+
+
+def ogg_duration(f, size):
+    head = f.read(HEAD_LENGTH)
+    if head[:4] != b"OggS" or len(head) < 28:
+        return None
+    serial = head[14:18]
+    packet_start = 27 + head[26]
+    packet = head[packet_start : packet_start + 19]  # noqa: E203
+    if packet[:7] == b"\x01vorbis":
+        sample_rate = struct.unpack("<I", packet[12:16])[0]
+        pre_skip = 0
+    elif packet[:8] == b"OpusHead":
+        # opus granule positions always count 48kHz samples
+        sample_rate = 48000
+        pre_skip = struct.unpack("<H", packet[10:12])[0]
+    else:
+        return None
+    if sample_rate == 0:
+        return None
+    tail_start = max(0, size - TAIL_LENGTH)
+    f.seek(tail_start)
+    tail = f.read(TAIL_LENGTH)
+    i = tail.rfind(b"OggS")
+    while i >= 0:
+        page = tail[i : i + 27]  # noqa: E203
+        if len(page) == 27 and page[4] == 0 and page[14:18] == serial:
+            granule = struct.unpack("<q", page[6:14])[0]
+            if granule >= 0:
+                return max(0, granule - pre_skip) * 1000 / sample_rate
+        i = tail.rfind(b"OggS", 0, i)
+    return None
+
+
+def mp4_atoms(f, start, end):
+    # yields (type, payload offset, payload end) for each atom in a range
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(16)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header[:8])
+        header_length = 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_length = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_length:
+            return
+        yield kind, offset + header_length, min(offset + size, end)
+        offset += size
+
+
+def mp4_header_duration(f, offset):
+    # mvhd and mdhd share their version, timescale and duration layout
+    f.seek(offset)
+    version = f.read(1)
+    if version == b"\x01":
+        f.seek(offset + 20)
+        timescale, duration = struct.unpack(">IQ", f.read(12))
+    else:
+        f.seek(offset + 12)
+        timescale, duration = struct.unpack(">II", f.read(8))
+    if timescale == 0:
+        return None
+    return duration * 1000 / timescale
+
+
+def mp4_duration(f, size):
+    movie_duration = None
+    for kind, start, end in mp4_atoms(f, 0, size):
+        if kind != b"moov":
+            continue
+        for kind, start, end in mp4_atoms(f, start, end):
+            if kind == b"mvhd":
+                movie_duration = mp4_header_duration(f, start)
+            elif kind == b"trak":
+                for kind, start, end in mp4_atoms(f, start, end):
+                    if kind != b"mdia":
+                        continue
+                    handler = None
+                    media_duration = None
+                    for kind, start, end in mp4_atoms(f, start, end):
+                        if kind == b"hdlr":
+                            f.seek(start + 8)
+                            handler = f.read(4)
+                        elif kind == b"mdhd":
+                            media_duration = mp4_header_duration(f, start)
+                    if handler == b"soun" and media_duration is not None:
+                        return media_duration
+        break
+    return movie_duration
+
+
+def asf_duration(f, size):
+    head = f.read(HEAD_LENGTH)
+    if head[:16] != ASF_HEADER:
+        return None
+    offset = 30
+    while offset + 24 <= len(head):
+        guid, object_size = struct.unpack_from("<16sQ", head, offset)
+        if guid == ASF_FILE_PROPERTIES:
+            play_duration, _, preroll = struct.unpack_from(
+                "<QQQ", head, offset + 64
+            )
+            return max(0, play_duration / 10000 - preroll)
+        if object_size < 24:
+            return None
+        offset += object_size
+    return None
+
+
+readers = {
+    ".mp2": mpeg_duration,
+    ".mp3": mpeg_duration,
+    ".m4a": mp4_duration,
+    ".wma": asf_duration,
+    ".ogg": ogg_duration,
+    ".opus": ogg_duration,
+    ".flac": flac_duration,
+}
+
+
+def duration_ms(path):
+    reader = readers.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        return None
+    try:
+        with open(path, mode="rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            return reader(f, size)
+    except (OSError, struct.error, IndexError, ValueError):
+        return None
+
+
+def compare(paths, tolerance):
+    from pymediainfo import MediaInfo
+
+    mismatches = 0
+    unread = 0
+    header_time = 0
+    mediainfo_time = 0
+    for path in paths:
+        start = time.perf_counter()
+        header_ms = duration_ms(path)
+        header_time += time.perf_counter() - start
+        start = time.perf_counter()
+        duration = MediaInfo.parse(path, output="Audio;%Duration%")
+        mediainfo_time += time.perf_counter() - start
+        mediainfo_ms = float(duration) if duration != "" else None
+        if header_ms is None:
+            unread += 1
+            print(f"header unread\t{mediainfo_ms}\t{path}")
+        elif (
+            mediainfo_ms is None
+            or abs(header_ms - mediainfo_ms) > tolerance * 1000
+        ):
+            mismatches += 1
+            print(f"mismatch\t{header_ms:.0f}\t{mediainfo_ms}\t{path}")
+    print(
+        f"\n{len(paths)} files: {mismatches} mismatched, "
+        f"{unread} not read from headers\n"
+        f"headers {header_time:.3f}s, MediaInfo {mediainfo_time:.3f}s"
+    )
+    return mismatches
+
+
+if __name__ == "__main__":
+    # compare header durations with MediaInfo on a sample of mediafiles
+    parser = argparse.ArgumentParser(
+        "media_duration",
+        description="Compare header durations with MediaInfo durations",
+    )
+    parser.add_argument("folder", help="mediafile sources folder")
+    parser.add_argument(
+        "-n",
+        "--sample",
+        type=int,
+        default=200,
+        help="number of mediafiles to compare (default: 200)",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="allowed difference in seconds (default: 1.0)",
+    )
+    args = parser.parse_args()
+    paths = [
+        os.path.join(dir, f)
+        for dir, _, files in os.walk(args.folder)
+        for f in files
+        if os.path.splitext(f)[1].lower() in readers
+    ]
+    random.seed(0)
+    if len(paths) > args.sample:
+        paths = random.sample(paths, args.sample)
+    sys.exit(1 if compare(paths, args.tolerance) else 0)
@@ -1,29 +1,1136 @@
 #!/usr/bin/env python3
 
-import configparser
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import mmap
+import multiprocessing
+import multiprocessing.connection
 import os
 import platform
 import re
+import select
+import struct
 import sys
+import threading
+import time
+import unicodedata
+from concurrent.futures import (
+    CancelledError,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+import media_duration
 
-from pymediainfo import MediaInfo
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QPixmap
-from PySide6.QtWidgets import (
-    QApplication,
-    QFileDialog,
-    QMessageBox,
-    QSplashScreen,
+# pls is shared with playlist-recomposer
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
 )
+import pls  # noqa: E402
+
+try:
+    from pymediainfo import MediaInfo
+except ImportError:
+    MediaInfo = None
+
+
+class ProbeCache:
+    # Probed mediafile lengths and normalised sidecar details,
+    # keyed by mediafile path. An entry is only valid while the
+    # mediafile's (size, mtime, inode) and its sidecar's (size, mtime)
+    # are unchanged, so unchanged files are neither probed nor read.
+    # Entries may also hold a mediafile's DuplicateFinder fingerprint.
+    # Mediafiles whose probe failed or stalled are quarantined: they
+    # aren't probed again until a retry time, which backs off with each
+    # failure, or until they change.
+    version = 1
+    retry_after = 3600
+    max_retry_after = 7 * 86400
+
+    def __init__(self, path=None):
+        if path is None:
+            path = self.default_path()
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.entries = {}
+        self.quarantine = {}
+        self.seen = set()
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def default_path():
+        if platform.system() == "Windows":
+            cache_dir = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+        else:
+            cache_dir = os.environ.get(
+                "XDG_CACHE_HOME", os.path.expanduser("~/.cache")
+            )
+        return os.path.join(
+            cache_dir, "kodi-classical", "playlist-generator-cache.json"
+        )
+
+    @staticmethod
+    def signature(media_stat, sidecar_stat):
+        signature = [
+            media_stat.st_size,
+            media_stat.st_mtime_ns,
+            media_stat.st_ino,
+        ]
+        if sidecar_stat:
+            signature += [sidecar_stat.st_size, sidecar_stat.st_mtime_ns]
+        return signature
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cache.get("version") == self.version:
+            self.entries = cache["entries"]
+            self.quarantine = cache.get("quarantine", {})
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.version,
+                    "entries": self.entries,
+                    "quarantine": self.quarantine,
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def get(self, path, signature):
+        self.seen.add(path)
+        entry = self.entries.get(path)
+        if entry and entry["signature"] == signature and "length" in entry:
+            self.hits += 1
+            return entry["length"], entry["details"]
+        self.misses += 1
+        return None
+
+    def put(self, path, signature, length, details):
+        entry = {
+            "signature": signature,
+            "length": length,
+            "details": details,
+        }
+        old = self.entries.get(path)
+        if old and old["signature"] == signature and "fingerprint" in old:
+            entry["fingerprint"] = old["fingerprint"]
+        self.entries[path] = entry
+        self.quarantine.pop(path, None)
+        self.dirty = True
+
+    def quarantined(self, path, signature):
+        # returns the reason a mediafile is quarantined, or None if it
+        # should be probed
+        entry = self.quarantine.get(path)
+        if (
+            entry
+            and entry["signature"] == signature
+            and time.time() < entry["retry"]
+        ):
+            return entry["reason"]
+        return None
+
+    def put_quarantine(self, path, signature, reason):
+        entry = self.quarantine.get(path)
+        if entry and entry["signature"] == signature:
+            failures = entry["failures"] + 1
+        else:
+            failures = 1
+        retry_after = min(
+            self.retry_after * 2 ** (failures - 1), self.max_retry_after
+        )
+        self.quarantine[path] = {
+            "signature": signature,
+            "failures": failures,
+            "retry": time.time() + retry_after,
+            "reason": reason,
+        }
+        self.dirty = True
+
+    def get_fingerprint(self, path, signature):
+        entry = self.entries.get(path)
+        if entry and entry["signature"] == signature:
+            return entry.get("fingerprint")
+        return None
+
+    def put_fingerprint(self, path, signature, fingerprint):
+        # a mediafile may be fingerprinted but never probed, e.g. a
+        # duplicate left out of the playlists
+        entry = self.entries.get(path)
+        if not entry or entry["signature"] != signature:
+            entry = self.entries[path] = {"signature": signature}
+        entry["fingerprint"] = fingerprint
+        self.dirty = True
+
+    def _forget(self, forget):
+        # removes the entries and quarantined mediafiles that forget
+        # returns True for
+        gone = False
+        for entries in (self.entries, self.quarantine):
+            for p in [p for p in entries if forget(p)]:
+                del entries[p]
+                gone = True
+        self.dirty = self.dirty or gone
+
+    def invalidate(self, path=None):
+        # forget everything, or a single mediafile or folder
+        if path is None:
+            self._forget(lambda p: True)
+        else:
+            self._forget(
+                lambda p: p == path or p.startswith(f"{path.rstrip('/')}/")
+            )
+
+    def prune(self, root):
+        # forget mediafiles below root that were not seen this run
+        self._forget(
+            lambda p: p.startswith(f"{root.rstrip('/')}/")
+            and p not in self.seen
+        )
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "quarantined": len(self.quarantine),
+        }
+
+
+class SearchIndex:
+    # A library-wide index of broadcast details, written next to the
+    # playlists so that search tools can load everything searchable in
+    # one read. Per playlist it holds the station and, per entry, the
+    # mediafile, date, length, details lowercased with diacritics
+    # stripped (as kodi-remote's filter) and the details' tokens.
+    # A dotfile, so that the playlists folder stays combineable.
+    # Each playlist's JSON is kept once encoded, as is the index last
+    # loaded or saved, so that watch mode, regenerating a station at a
+    # time with the index kept loaded, only encodes what changed.
+    version = 1
+    file_name = ".search-index.json"
+    fields = ("file", "date", "length", "text", "tokens")
+
+    def __init__(self, playlists_dir):
+        self.path = f"{playlists_dir}/{self.file_name}"
+        self.playlists = {}
+        # {playlist file name: its JSON}
+        self.encoded = {}
+        self.saved = None
+
+    @staticmethod
+    def normalize(text):
+        return "".join(
+            c
+            for c in unicodedata.normalize("NFD", text)
+            if unicodedata.category(c) != "Mn"
+        ).lower()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = f.read()
+            index = json.loads(saved)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == self.version:
+            self.playlists = index["playlists"]
+            self.encoded = {}
+            self.saved = saved
+
+    def remove_station(self, station):
+        self.remove(
+            [p for p, v in self.playlists.items() if v["station"] == station]
+        )
+
+    def remove(self, playlists):
+        for playlist in playlists:
+            self.playlists.pop(playlist, None)
+            self.encoded.pop(playlist, None)
+
+    @staticmethod
+    def _encode(value):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
 
+    def add(self, playlist, station, media_list):
+        entries = []
+        for file, modified, details, length in media_list:
+            text = self.normalize(details)
+            entries.append(
+                [
+                    file,
+                    time.strftime("%Y-%m-%d", time.localtime(float(modified))),
+                    int(length),
+                    text,
+                    list(dict.fromkeys(re.findall(r"\w+", text))),
+                ]
+            )
+        self.playlists[playlist] = {"station": station, "entries": entries}
+        self.encoded.pop(playlist, None)
+
+    def save(self):
+        # as playlists, only rewritten when changed. The same JSON as
+        # json.dumps would write, from each playlist's kept JSON
+        for playlist, value in self.playlists.items():
+            if playlist not in self.encoded:
+                self.encoded[playlist] = self._encode(value)
+        playlists = ",".join(
+            f"{self._encode(p)}:{self.encoded[p]}"
+            for p in sorted(self.playlists)
+        )
+        index = (
+            f'{{"version":{self._encode(self.version)},'
+            f'"fields":{self._encode(self.fields)},'
+            f'"playlists":{{{playlists}}}}}'
+        )
+        if self.saved is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.saved = f.read()
+            except (OSError, ValueError):
+                pass
+        if index == self.saved:
+            return False
+        tmp = f"{self.path}.tmp"
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            f.write(index)
+        os.replace(tmp, self.path)
+        self.saved = index
+        return True
+
+
+class FacetIndex:
+    # Composers, performers and works extracted from broadcast details,
+    # written next to the playlists so that e.g. every Tchaikovsky
+    # broadcast on every station is a lookup rather than a scan.
+    # Per playlist it holds the station and, per entry, the mediafile,
+    # modified time, length, details and the entry's facets. Composers
+    # (by normalised name, with a surname lookup) and performers then
+    # refer to entries by [playlist, entry index].
+    #
+    # Details are scraped broadcast webpages, so extraction is
+    # heuristic, line by line:
+    #     Composer[/Composer]: Work
+    #     Performer (role)[, Performer (role)]
+    #     Role: Performer
+    #     An Ensemble Name, e.g. ... Orchestra, ... Quartet
+    version = 1
+    file_name = ".facet-index.json"
+    fields = ("file", "modified", "length", "title", "facets")
+
+    roles = set(
+        (
+            "alto, bandoneon, baritone, bass, bass-baritone, bassoon, cello, "
+            "chorus master, clarinet, conductor, contralto, countertenor, "
+            "director, double bass, flute, fortepiano, guitar, harp, "
+            "harpsichord, horn, leader, lute, mezzo-soprano, oboe, organ, "
+            "percussion, piano, recorder, saxophone, soprano, tenor, "
+            "treble, trombone, trumpet, tuba, viola, viola da gamba, violin, "
+            "vocals"
+        ).split(", ")
+    )
+    # labels whose lines are neither works nor performers
+    ignored = {"host", "presenter", "producer", "recorded", "broadcast"}
+    # also as the end of compound words, e.g. Rundfunkchor
+    ensembles = re.compile(
+        r"(?:orchest(?:ra|re|er)|orquesta|orkest|philharmoni\w*|symphoniker"
+        r"|choir|chor(?:us)?|ensemble|quartet|quintet|trio|consort"
+        r"|sinfonietta|camerata|players|soloists|singers)\b",
+        flags=re.IGNORECASE,
+    )
+    # name particles, the only lowercase words allowed in a name
+    particles = set(
+        "al da de del della der di du la le ten van von y zu".split()
+    )
+    role_pattern = re.compile(r"\(([^()]+)\)")
+
+    def __init__(self, playlists_dir):
+        self.path = f"{playlists_dir}/{self.file_name}"
+        self.playlists = {}
+
+    @staticmethod
+    def is_name(text):
+        words = text.split()
+        if not 0 < len(words) <= 6 or re.search(r"[\d()\[\]\"]", text):
+            return False
+        return words[0][0].isupper() and all(
+            w[0].isupper() or w in __class__.particles for w in words
+        )
+
+    @staticmethod
+    def find_roles(line):
+        # returns [(name, role)] for each "Name (role)" in line, as
+        # ([^,;()]+?)\s*\(([^()]+)\) would but without its quadratic
+        # backtracking on long lines: each parenthesis is matched, then
+        # its name looked for back to the separator before it
+        roles = []
+        end = 0
+        for m in __class__.role_pattern.finditer(line):
+            start = max(line.rfind(c, end, m.start()) for c in ",;()")
+            name = line[max(start + 1, end) : m.start()]
+            if name:
+                roles.append((name, m.group(1)))
+            end = m.end()
+        return roles
+
+    @staticmethod
+    def extract(details):
+        # returns {"composers": [name], "performers": [[name, role]],
+        # "works": [[composer, work]]} for a playlist entry's details
+        composers = []
+        performers = []
+        works = []
+        for line in details.split(" | "):
+            line = line.strip()
+            label, colon, rest = line.partition(":")
+            label = label.strip()
+            rest = rest.strip()
+            if colon and label.lower() in __class__.ignored:
+                continue
+            if colon and label.lower() in __class__.roles:
+                if __class__.is_name(rest):
+                    performers.append([rest, label.lower()])
+                continue
+            roles = [
+                [name.strip(), role.strip().lower()]
+                for name, role in __class__.find_roles(line)
+                if role.strip().lower() in __class__.roles
+                and __class__.is_name(name.strip())
+            ]
+            if roles:
+                performers += roles
+                continue
+            names = re.split(r"\s*/\s*|\s+&\s+|\s+and\s+", label)
+            if colon and rest and all(__class__.is_name(n) for n in names):
+                composers += names
+                works += [[n, rest] for n in names]
+            elif (
+                not colon
+                and __class__.ensembles.search(line)
+                and len(line.split()) <= 8
+                and not re.search(r"\d", line)
+            ):
+                performers.append([line, "ensemble"])
+        return {
+            "composers": list(dict.fromkeys(composers)),
+            "performers": [
+                list(p) for p in dict.fromkeys(map(tuple, performers))
+            ],
+            "works": [list(w) for w in dict.fromkeys(map(tuple, works))],
+        }
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == self.version:
+            self.playlists = index["playlists"]
+
+    def remove_station(self, station):
+        for playlist in [
+            p for p, v in self.playlists.items() if v["station"] == station
+        ]:
+            del self.playlists[playlist]
 
-class FolderDialog(QFileDialog):
-    def __init__(self, title, rootdir=None):
-        QFileDialog.__init__(self)
-        self.setWindowTitle(title)
-        self.setFileMode(QFileDialog.Directory)
-        if rootdir:
-            self.setDirectory(rootdir)
+    def remove(self, playlists):
+        for playlist in playlists:
+            self.playlists.pop(playlist, None)
+
+    def add(self, playlist, station, media_list):
+        self.playlists[playlist] = {
+            "station": station,
+            "entries": [
+                [file, modified, length, details, self.extract(details)]
+                for file, modified, details, length in media_list
+            ],
+        }
+
+    def composers(self):
+        # returns {normalised name: {"names", "works", "entries"}}
+        composers = {}
+        for playlist, v in sorted(self.playlists.items()):
+            for i, entry in enumerate(v["entries"]):
+                facets = entry[4]
+                for name in facets["composers"]:
+                    c = composers.setdefault(
+                        SearchIndex.normalize(name),
+                        {"names": {}, "works": {}, "entries": []},
+                    )
+                    c["names"][name] = c["names"].get(name, 0) + 1
+                    c["entries"].append([playlist, i])
+                for name, work in facets["works"]:
+                    composers[SearchIndex.normalize(name)]["works"][work] = 1
+        for c in composers.values():
+            # most used spelling first
+            c["names"] = sorted(c["names"], key=lambda n: -c["names"][n])
+            c["works"] = sorted(c["works"])
+        return dict(sorted(composers.items()))
+
+    def performers(self):
+        # returns {normalised name: {"names", "roles", "entries"}}
+        performers = {}
+        for playlist, v in sorted(self.playlists.items()):
+            for i, entry in enumerate(v["entries"]):
+                for name, role in entry[4]["performers"]:
+                    p = performers.setdefault(
+                        SearchIndex.normalize(name),
+                        {"names": {}, "roles": {}, "entries": []},
+                    )
+                    p["names"][name] = p["names"].get(name, 0) + 1
+                    p["roles"][role] = 1
+                    if p["entries"][-1:] != [[playlist, i]]:
+                        p["entries"].append([playlist, i])
+        for p in performers.values():
+            p["names"] = sorted(p["names"], key=lambda n: -p["names"][n])
+            p["roles"] = sorted(p["roles"])
+        return dict(sorted(performers.items()))
+
+    def composer_media(self):
+        # yields (composer, media_list) with media_list rows as
+        # PlaylistGenerator's, most recent first
+        for c in self.composers().values():
+            media_list = []
+            for playlist, i in c["entries"]:
+                file, modified, length, details, _ = self.playlists[playlist][
+                    "entries"
+                ][i]
+                media_list.append([file, modified, details, length])
+            media_list.sort(key=lambda m: float(m[1]), reverse=True)
+            yield c["names"][0], media_list
+
+    def save(self):
+        # as playlists, only rewritten when changed
+        composers = self.composers()
+        surnames = {}
+        for key in composers:
+            surnames.setdefault(key.split()[-1], []).append(key)
+        index = json.dumps(
+            {
+                "version": self.version,
+                "fields": self.fields,
+                "playlists": dict(sorted(self.playlists.items())),
+                "composers": composers,
+                "surnames": dict(sorted(surnames.items())),
+                "performers": self.performers(),
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                if f.read() == index:
+                    return False
+        except (OSError, ValueError):
+            pass
+        tmp = f"{self.path}.tmp"
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            f.write(index)
+        os.replace(tmp, self.path)
+        return True
+
+
+class DuplicateFinder:
+    # Finds copies of the same recording, e.g. a concert relayed by
+    # several stations or rebroadcast, by a cheap fingerprint: the
+    # mediafile's size and a hash of chunks sampled evenly through it,
+    # read via mmap. Only mediafiles that share their size with another
+    # are fingerprinted. Each group's earliest recording is its original,
+    # and the groups are reported in a dotfile alongside the playlists.
+    version = 1
+    file_name = ".duplicates.json"
+    samples = 16
+    sample_length = 16384
+
+    def __init__(self, playlists_dir):
+        self.path = f"{playlists_dir}/{self.file_name}"
+        # [{"size", "fingerprint", "original", "copies"}], with paths
+        # relative to the sources folder
+        self.groups = []
+        # mediafiles that couldn't be fingerprinted, so weren't compared
+        self.skipped = []
+
+    @staticmethod
+    def fingerprint(f_fqp, samples=samples, sample_length=sample_length):
+        # returns a hex digest, or None if the mediafile can't be read
+        h = hashlib.blake2b(digest_size=16)
+        try:
+            with open(f_fqp, mode="rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                h.update(size.to_bytes(8, "little"))
+                if size == 0:
+                    # mmap can't map an empty file
+                    return h.hexdigest()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    if size <= samples * sample_length:
+                        h.update(m)
+                    else:
+                        step = (size - sample_length) // (samples - 1)
+                        for i in range(samples):
+                            m.seek(i * step)
+                            h.update(m.read(sample_length))
+        except (OSError, ValueError):
+            return None
+        return h.hexdigest()
+
+    def find(self, sources_dir, pending, cache=None, workers=1):
+        # pending is [(folder, media)] as scanned by PlaylistGenerator,
+        # returns the set of copies, i.e. duplicates other than originals.
+        # Fingerprints are read by a pool of worker threads of their
+        # own, so they neither queue behind probes nor share their
+        # deadline.
+        sizes = {}
+        for _, media in pending:
+            for m in media:
+                sizes.setdefault(m[5], []).append(m)
+        candidates = []
+        fingerprints = {}
+        self.skipped = []
+        executor = None
+        if workers > 1:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for same_size in sizes.values():
+                if len(same_size) < 2:
+                    continue
+                for f_fqp, _, modified, signature, _, size in same_size:
+                    fingerprint = None
+                    if cache:
+                        fingerprint = cache.get_fingerprint(f_fqp, signature)
+                    cached = fingerprint is not None
+                    if not cached and executor:
+                        fingerprint = executor.submit(
+                            __class__.fingerprint, f_fqp
+                        )
+                    candidates.append(
+                        (f_fqp, modified, size, signature, cached, fingerprint)
+                    )
+            for candidate in candidates:
+                f_fqp, modified, size, signature, cached, fingerprint = (
+                    candidate
+                )
+                if isinstance(fingerprint, Future):
+                    fingerprint = fingerprint.result()
+                elif fingerprint is None:
+                    fingerprint = __class__.fingerprint(f_fqp)
+                if fingerprint is None:
+                    self.skipped.append(f_fqp)
+                    continue
+                if cache and not cached:
+                    cache.put_fingerprint(f_fqp, signature, fingerprint)
+                fingerprints.setdefault((size, fingerprint), []).append(
+                    (f_fqp, modified)
+                )
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        start = len(sources_dir) + 1
+        self.groups = []
+        copies = set()
+        for (size, fingerprint), group in fingerprints.items():
+            if len(group) < 2:
+                continue
+            group.sort(key=lambda g: (float(g[1]), g[0]))
+            copies.update(f_fqp for f_fqp, _ in group[1:])
+            self.groups.append(
+                {
+                    "size": size,
+                    "fingerprint": fingerprint,
+                    "original": group[0][0][start:],
+                    "copies": [f_fqp[start:] for f_fqp, _ in group[1:]],
+                }
+            )
+        self.groups.sort(key=lambda g: g["original"])
+        return copies
+
+    def copies(self, sources_dir):
+        return {
+            f"{sources_dir}/{copy}"
+            for group in self.groups
+            for copy in group["copies"]
+        }
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return
+        if report.get("version") == self.version:
+            self.groups = report["groups"]
+
+    def save(self):
+        # as playlists, only rewritten when changed
+        report = json.dumps(
+            {"version": self.version, "groups": self.groups},
+            ensure_ascii=False,
+            indent=1,
+        )
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                if f.read() == report:
+                    return False
+        except (OSError, ValueError):
+            pass
+        tmp = f"{self.path}.tmp"
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            f.write(report)
+        os.replace(tmp, self.path)
+        return True
+
+
+class PlaylistStamps:
+    # When each playlist was last generated, written next to the
+    # playlists, for PlaylistVerifier. A playlist whose contents haven't
+    # changed isn't rewritten, so keeps its mtime however recently its
+    # mediafiles were modified; its stamp is the newest modified time
+    # of the mediafiles it was last generated from, so that stamps, like
+    # playlists, only change when their mediafiles do.
+    version = 1
+    file_name = ".generated.json"
+
+    def __init__(self, playlists_dir):
+        self.path = f"{playlists_dir}/{self.file_name}"
+        # {playlist file name: seconds since the epoch}
+        self.playlists = {}
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stamps = json.load(f)
+        except (OSError, ValueError):
+            return
+        if stamps.get("version") == self.version:
+            self.playlists = stamps["playlists"]
+
+    def update(self, stamps):
+        self.playlists.update(stamps)
+
+    def remove(self, playlists):
+        for playlist in playlists:
+            self.playlists.pop(playlist, None)
+
+    def save(self):
+        # as playlists, only rewritten when changed
+        stamps = json.dumps(
+            {
+                "version": self.version,
+                "playlists": dict(sorted(self.playlists.items())),
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                if f.read() == stamps:
+                    return False
+        except (OSError, ValueError):
+            pass
+        tmp = f"{self.path}.tmp"
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            f.write(stamps)
+        os.replace(tmp, self.path)
+        return True
+
+
+class TreeWalker:
+    # An os.walk replacement built on os.scandir. Folders are listed
+    # concurrently, as soon as their parent has been listed, but are
+    # yielded in the same top-down order as os.walk. Files are yielded
+    # as DirEntry objects so that their stat data can be reused, and
+    # the metadata syscalls issued are counted.
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self.listings = 0
+        self.stat_calls = 0
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def walk(self, top):
+        # yields (folder, subfolder names, file DirEntries)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.executor = executor
+            yield from self._walk(top, executor.submit(self._list, top))
+
+    def _walk(self, dir, listing):
+        dirs, files, children = listing.result()
+        yield dir, dirs, files
+        for child, child_listing in children:
+            yield from self._walk(child, child_listing)
+
+    def _list(self, dir):
+        dirs = []
+        files = []
+        children = []
+        try:
+            with os.scandir(dir) as it:
+                entries = list(it)
+        except OSError:
+            # as os.walk, skip folders that can't be listed
+            entries = []
+        with self.lock:
+            self.listings += 1
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry.name)
+                # as os.walk, don't follow symlinks to folders
+                if not entry.is_symlink():
+                    child = os.path.join(dir, entry.name)
+                    children.append(
+                        (child, self.executor.submit(self._list, child))
+                    )
+            else:
+                files.append(entry)
+        return dirs, files, children
+
+    def stat(self, entry):
+        # DirEntry caches stat results, and on Windows already has
+        # them from the folder listing
+        if platform.system() != "Windows":
+            with self.lock:
+                self.stat_calls += 1
+        return entry.stat()
+
+
+class InotifyWatch:
+    # Linux inotify, via libc. changes() returns the folders in which
+    # mediafiles or sidecars were written, moved or deleted, and those
+    # moved or deleted, and new subfolders are watched as they appear.
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    mask = (
+        IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+        | IN_ONLYDIR
+    )
+
+    def __init__(self, suffixes):
+        self.suffixes = suffixes
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+
+    @staticmethod
+    def available():
+        return platform.system() == "Linux"
+
+    def add(self, dir):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir), self.mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {dir}")
+        self.dirs[wd] = dir
+
+    def changes(self, timeout):
+        # returns a set of changed folders, or None if events were lost
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        buffer = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = struct.unpack_from("iIII", buffer, offset)
+            offset += 16
+            name = buffer[offset : offset + length]  # noqa: E203
+            name = os.fsdecode(name.rstrip(b"\0"))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            dir = self.dirs.get(wd)
+            if dir is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self.dirs[wd]
+            elif mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    child = os.path.join(dir, name)
+                    for subdir, _, _ in os.walk(child):
+                        self.add(subdir)
+                        changed.add(subdir)
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    # so that a station's playlists go with its folder
+                    changed.add(os.path.join(dir, name))
+            elif name.endswith(self.suffixes):
+                changed.add(dir)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatch:
+    # Fallback for platforms without inotify: every interval, compare
+    # each watched folder's mediafiles and sidecars with the last look,
+    # a folder that has gone counting as changed
+    def __init__(self, suffixes, interval=10.0):
+        self.suffixes = suffixes
+        self.interval = interval
+        self.snapshots = {}
+        self.next_poll = time.monotonic() + interval
+
+    def snapshot(self, dir):
+        snapshot = {}
+        subdirs = []
+        try:
+            with os.scandir(dir) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        subdirs.append(e.path)
+                    elif e.name.endswith(self.suffixes):
+                        st = e.stat()
+                        snapshot[e.name] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None, []
+        return snapshot, subdirs
+
+    def add(self, dir):
+        self.snapshots[dir] = self.snapshot(dir)[0]
+
+    def changes(self, timeout):
+        wait = self.next_poll - time.monotonic()
+        if timeout is not None and timeout < wait:
+            time.sleep(max(0, timeout))
+            return set()
+        time.sleep(max(0, wait))
+        self.next_poll = time.monotonic() + self.interval
+        changed = set()
+        for dir, old in list(self.snapshots.items()):
+            new, subdirs = self.snapshot(dir)
+            if new is None:
+                del self.snapshots[dir]
+                changed.add(dir)
+                continue
+            if new != old:
+                self.snapshots[dir] = new
+                changed.add(dir)
+            for subdir in subdirs:
+                if subdir not in self.snapshots:
+                    for d, _, _ in os.walk(subdir):
+                        self.add(d)
+                        changed.add(d)
+        return changed
+
+    def close(self):
+        pass
+
+
+class DeadlinePool:
+    # A pool of worker processes whose calls must finish within timeout
+    # seconds of starting. A call only starts once a worker is free to
+    # run it, so time spent queued behind a stalled call doesn't count
+    # against its deadline. A worker whose call misses its deadline is
+    # killed and replaced, and the call's future raises
+    # FutureTimeoutError, so a stalled call holds up neither the calls
+    # queued behind it nor the interpreter's exit.
+
+    def __init__(self, workers=1, timeout=None):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.context = multiprocessing.get_context()
+        self.lock = threading.Lock()
+        # (future, fn, args) not yet started
+        self.queue = collections.deque()
+        self.shutting_down = False
+        self.wait = True
+        self.wakeup_reader, self.wakeup_writer = self.context.Pipe(
+            duplex=False
+        )
+        # the dispatcher thread alone starts, feeds and kills workers
+        self.idle = []
+        # {connection: (process, future, deadline)}
+        self.busy = {}
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _serve(conn):
+        # a worker's loop, running calls until its pipe is closed
+        while True:
+            try:
+                fn, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                result = (True, fn(*args))
+            except Exception as e:
+                result = (False, e)
+            try:
+                conn.send(result)
+            except Exception as e:
+                # e.g. a result or exception that can't be pickled
+                conn.send((False, RuntimeError(repr(e))))
+
+    def submit(self, fn, *args):
+        future = Future()
+        with self.lock:
+            if self.shutting_down:
+                raise RuntimeError("cannot submit after shutdown")
+            self.queue.append((future, fn, args))
+        self.wakeup_writer.send_bytes(b"")
+        return future
+
+    def _start_worker(self):
+        conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=__class__._serve, args=(child_conn,), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return process, conn
+
+    @staticmethod
+    def _stop_worker(process, conn):
+        process.kill()
+        process.join()
+        conn.close()
+
+    def _start_calls(self):
+        while len(self.busy) < self.workers:
+            with self.lock:
+                if not self.queue:
+                    return
+                future, fn, args = self.queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.idle:
+                    process, conn = self.idle.pop()
+                else:
+                    process, conn = self._start_worker()
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            try:
+                conn.send((fn, args))
+            except Exception as e:
+                # fn or args can't be pickled, the worker is still idle
+                self.idle.append((process, conn))
+                future.set_exception(e)
+                continue
+            deadline = None
+            if self.timeout:
+                deadline = time.monotonic() + self.timeout
+            self.busy[conn] = (process, future, deadline)
+
+    def _finish_call(self, conn):
+        process, future, _ = self.busy.pop(conn)
+        try:
+            ok, value = conn.recv()
+        except (EOFError, OSError):
+            # the worker died, e.g. crashed in a native library
+            self._stop_worker(process, conn)
+            future.set_exception(
+                BrokenProcessPool(
+                    f"worker exited with code {process.exitcode}"
+                )
+            )
+            return
+        self.idle.append((process, conn))
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _expire_calls(self):
+        now = time.monotonic()
+        for conn, (process, future, deadline) in list(self.busy.items()):
+            if deadline is not None and deadline <= now:
+                del self.busy[conn]
+                self._stop_worker(process, conn)
+                future.set_exception(FutureTimeoutError())
+
+    def _dispatch(self):
+        while True:
+            with self.lock:
+                if self.shutting_down and (
+                    not self.wait or (not self.queue and not self.busy)
+                ):
+                    break
+            self._start_calls()
+            deadlines = [d for _, _, d in self.busy.values() if d is not None]
+            timeout = None
+            if deadlines:
+                timeout = max(0, min(deadlines) - time.monotonic())
+            ready = multiprocessing.connection.wait(
+                list(self.busy) + [self.wakeup_reader], timeout
+            )
+            for conn in ready:
+                if conn is self.wakeup_reader:
+                    while self.wakeup_reader.poll():
+                        self.wakeup_reader.recv_bytes()
+                else:
+                    self._finish_call(conn)
+            self._expire_calls()
+        # without waiting, calls not yet finished are abandoned
+        with self.lock:
+            while self.queue:
+                self.queue.popleft()[0].cancel()
+        for process, future, _ in self.busy.values():
+            future.set_exception(CancelledError())
+        for process, conn in self.idle + [
+            (process, conn) for conn, (process, _, _) in self.busy.items()
+        ]:
+            self._stop_worker(process, conn)
+        self.idle = []
+        self.busy = {}
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self.lock:
+            self.shutting_down = True
+            self.wait = wait
+            if cancel_futures:
+                while self.queue:
+                    self.queue.popleft()[0].cancel()
+        self.wakeup_writer.send_bytes(b"")
+        self.thread.join()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
 
 
 class PlaylistGenerator:
@@ -38,16 +1145,60 @@ class PlaylistGenerator:
         # add as required
     )
 
+    @dataclass
+    class Options:
+        # workers > 1 probes media durations concurrently,
+        # pool is either "thread" or "process", though probes with a
+        # probe_timeout always run in worker processes
+        workers: int = 1
+        pool: str = "thread"
+        # a ProbeCache, or None to probe every mediafile
+        cache: ProbeCache = None
+        # read durations from container headers,
+        # falling back to MediaInfo for anything else
+        fast_probe: bool = True
+        # remove playlists whose source folder no longer has mediafiles
+        prune: bool = False
+        # split a station's playlist into shards of at most shard_size
+        # bytes and/or by shard_by "year" or "month" of recording
+        shard_size: int = 0
+        shard_by: str = None
+        # write a SearchIndex alongside the playlists
+        search_index: bool = True
+        # write a FacetIndex alongside the playlists and, given a folder
+        # sharing their parent, a playlist per composer there. Opt-in,
+        # as it is encoded whole, even when one folder changes
+        facet_index: bool = False
+        composer_playlists: str = None
+        # report copies of the same recording found by a DuplicateFinder
+        # and, with unique, leave them out of the playlists
+        find_duplicates: bool = False
+        unique: bool = False
+        # seconds a mediafile's probe may run before it is killed and
+        # the mediafile quarantined
+        probe_timeout: float = None
+
+    @dataclass
+    class Summary:
+        folders_listed: int = 0
+        stat_calls: int = 0
+        # playlist file names
+        written: list = field(default_factory=list)
+        unchanged: list = field(default_factory=list)
+        removed: list = field(default_factory=list)
+        # {playlist file name: newest modified time of its mediafiles}
+        newest: dict = field(default_factory=dict)
+        # DuplicateFinder groups, if looked for, and the mediafiles that
+        # couldn't be fingerprinted, so weren't compared
+        duplicates: list = field(default_factory=list)
+        unfingerprinted: list = field(default_factory=list)
+        # (mediafile, reason) for mediafiles listed with a length of 0
+        quarantined: list = field(default_factory=list)
+        # composer playlist file names, if written
+        composers: list = field(default_factory=list)
+
     @staticmethod
-    def _generate_playlist(playlist_dir, station, media_list):
-        cp = configparser.ConfigParser(interpolation=None)
-        cp.optionxform = lambda option: option
-        cp.add_section("playlist")
-        # kodi plays single item playlists but
-        # doesn't expand them for browsing,
-        # so append a dummy item
-        if len(media_list) == 1:
-            media_list.append(["\\", None, "", ""])
+    def _playlist_entries(media_list):
         for i, m in enumerate(media_list):
             # m = [
             #     mediafile relative path,
@@ -59,115 +1210,815 @@ class PlaylistGenerator:
             # Hence a zero padded index will be prefixed to title
             # so that kodi_remote users can browse most
             # recent broadcasts in descending order.
-            cp.set("playlist", f"File{i + 1}", m[0])
             if m[2] > "":
                 t = f"{format(i + 1, '04d')}.{m[2]}"
             else:
                 t = ""
-            cp.set("playlist", f"Title{i + 1}", t)
-            cp.set("playlist", f"Length{i + 1}", f"{m[3]}")
-        cp.set("playlist", "NumberOfEntries", f"{i + 1}")
-        cp.set("playlist", "Version", f"{2}")
+            yield m[0], t, f"{m[3]}"
+
+    dummy_item = ["\\", None, "", ""]
+
+    @staticmethod
+    def _generate_playlist(playlist_dir, station, media_list):
+        # kodi plays single item playlists but
+        # doesn't expand them for browsing,
+        # so append a dummy item
+        if len(media_list) == 1:
+            media_list.append(__class__.dummy_item)
         fn = f"{playlist_dir}/{station}.pls"
-        with open(fn, mode="w", encoding="latin-1") as f:
-            cp.write(f, space_around_delimiters=False)
-            # https://bugs.python.org/issue32917
-            # 'ConfigParser writes a superfluous final blank line'
-            # ...which causes kodi to ignore the playlist, thanks!
-            if platform.system() == "Windows":
-                newline_len = 2
+        written = pls.write_playlist(
+            fn, __class__._playlist_entries(media_list)
+        )
+        return f"{station}.pls", written
+
+    @staticmethod
+    def _pack(media_list, shard_size):
+        # Packs from the oldest recording, so older shards don't change
+        # as recordings are added and the newest shard is the smallest.
+        # Sizes are worked out for the widest entry and title indexes
+        # any shard could need, so no shard exceeds shard_size.
+        n = len(media_list)
+        widest = 10 ** len(str(n)) - 1
+        reserve = pls.envelope_length(n) + pls.entry_length(
+            widest, __class__.dummy_item[0], "", ""
+        )
+        shards = []
+        shard = []
+        size = reserve
+        for m in reversed(media_list):
+            title = f"{format(widest, '04d')}.{m[2]}" if m[2] > "" else ""
+            s = pls.entry_length(widest, m[0], title, f"{m[3]}")
+            if shard and size + s > shard_size:
+                shards.append(shard[::-1])
+                shard = []
+                size = reserve
+            shard.append(m)
+            size += s
+        if shard:
+            shards.append(shard[::-1])
+        return shards
+
+    @staticmethod
+    def _shard(station, media_list, options):
+        # yields (playlist name, media_list) for each of a station's
+        # playlists, named so that they sort oldest first
+        if options.shard_by:
+            fmt = "%Y" if options.shard_by == "year" else "%Y-%m"
+            periods = {}
+            for m in media_list:
+                period = time.strftime(fmt, time.localtime(float(m[1])))
+                periods.setdefault(period, []).append(m)
+            groups = [(f"{station} - {p}", periods[p]) for p in periods]
+        else:
+            groups = [(station, media_list)]
+        for name, group in groups:
+            if options.shard_size:
+                shards = __class__._pack(group, options.shard_size)
+                for i, shard in enumerate(shards, start=1):
+                    yield f"{name} - p{i:03d}", shard
             else:
-                newline_len = 1
-            new_eof = f.tell() - newline_len
-            f.seek(new_eof)
-            f.truncate()
+                yield name, group
+
+    @staticmethod
+    def _probe_duration(f_fqp, fast_probe=True):
+        if fast_probe:
+            duration = media_duration.duration_ms(f_fqp)
+            if duration is not None:
+                return f"{round(duration / 1000)}"
+        if MediaInfo is None:
+            return "0"
+        duration = MediaInfo.parse(f_fqp, output="Audio;%Duration%")
+        if duration != "":
+            return f"{round(float(duration) / 1000)}"
+        else:
+            return "0"
+
+    @staticmethod
+    def _read_details(f_fqp, f_txt):
+        if f_txt:
+            with open(f_txt, encoding="latin-1") as f:
+                d = f.read()
+            return re.sub(r"\s*[\r\n]+", " | ", d)
+        else:
+            return f_fqp.rpartition("/")[2]
+
+    @staticmethod
+    def _probe_media(f_fqp, f_txt, fast_probe=True):
+        length = __class__._probe_duration(f_fqp, fast_probe)
+        return length, __class__._read_details(f_fqp, f_txt)
+
+    @staticmethod
+    def _create_executor(options):
+        workers = max(1, options.workers)
+        if options.probe_timeout:
+            # a stalled probe can only be given up on, and its worker
+            # freed, by killing a worker process
+            return DeadlinePool(workers, options.probe_timeout)
+        if workers == 1:
+            return None
+        if options.pool == "process":
+            return ProcessPoolExecutor(max_workers=workers)
+        elif options.pool == "thread":
+            return ThreadPoolExecutor(max_workers=workers)
+        else:
+            raise ValueError(f"Unknown worker pool: {options.pool}")
+
+    @staticmethod
+    def share_parent(sources_dir, playlists_dir):
+        sf_parent = os.path.abspath(os.path.join(sources_dir, os.pardir))
+        pf_parent = os.path.abspath(os.path.join(playlists_dir, os.pardir))
+        return sf_parent == pf_parent
+
+    @staticmethod
+    def _scan_folder(dir, files, walker, cache, executor, options):
+        # returns the folder's mediafiles, each with either its cached
+        # probe results, a pending probe, the reason it is quarantined,
+        # or None to probe it later
+        # pair mediafiles with sidecars from the folder listing
+        sidecars = {
+            os.path.normcase(e.name): e
+            for e in files
+            if e.name.endswith(".txt")
+        }
+        media = []
+        for entry in files:
+            f = entry.name
+            if f.endswith(__class__.media_types):
+                f_fqp = f"{dir}/{f}"
+                sidecar = sidecars.get(
+                    os.path.normcase(f"{f.rpartition('.')[0]}.txt")
+                )
+                if sidecar:
+                    f_txt = f"{dir}/{sidecar.name}"
+                else:
+                    f_txt = None
+                st = walker.stat(entry)
+                signature = None
+                probed = None
+                if cache:
+                    if sidecar:
+                        st_txt = walker.stat(sidecar)
+                    else:
+                        st_txt = None
+                    signature = ProbeCache.signature(st, st_txt)
+                    probed = cache.get(f_fqp, signature)
+                    if probed is None:
+                        probed = cache.quarantined(f_fqp, signature)
+                if probed is None and executor:
+                    probed = executor.submit(
+                        __class__._probe_media,
+                        f_fqp,
+                        f_txt,
+                        options.fast_probe,
+                    )
+                media.append(
+                    (f_fqp, f_txt, st.st_mtime, signature, probed, st.st_size)
+                )
+        return media
 
     @staticmethod
-    def generate_playlists(playlists_dir, sources_dir, splashscreen=None):
+    def _resolve_probes(media, cache, options, quarantined=None):
+        # returns (mediafile, modified time, length, details) for each of
+        # a folder's mediafiles, waiting for or running its probe.
+        # Mediafiles whose probe fails or misses its deadline get a
+        # length of 0, are quarantined in the cache, and are appended to
+        # quarantined, if given, with the reason.
+        resolved = []
+        for f_fqp, f_txt, modified, signature, probed, _ in media:
+            reason = None
+            try:
+                if probed is None:
+                    length, details = __class__._probe_media(
+                        f_fqp, f_txt, options.fast_probe
+                    )
+                elif isinstance(probed, Future):
+                    # the pool keeps the deadline, from the probe's start
+                    length, details = probed.result()
+                elif isinstance(probed, str):
+                    reason = probed
+                else:
+                    length, details = probed
+            except FutureTimeoutError:
+                reason = f"probe timed out after {options.probe_timeout:g}s"
+            except (OSError, ValueError, BrokenProcessPool) as e:
+                # the mediafile can't be read or parsed, or its probe
+                # crashed its worker; anything else is a bug
+                reason = f"probe failed: {e!r}"
+            if reason:
+                length = "0"
+                try:
+                    details = __class__._read_details(f_fqp, f_txt)
+                except OSError:
+                    details = f_fqp.rpartition("/")[2]
+                if cache and not isinstance(probed, str):
+                    cache.put_quarantine(f_fqp, signature, reason)
+                if quarantined is not None:
+                    quarantined.append((f_fqp, reason))
+            elif cache and not isinstance(probed, tuple):
+                cache.put(f_fqp, signature, length, details)
+            resolved.append((f_fqp, modified, length, details))
+        return resolved
+
+    @staticmethod
+    def _sorted_media_list(playlists_dir, sources_dir, resolved):
         common_root = playlists_dir.rpartition("/")[0]
         sd_relative = sources_dir.partition(common_root)[2][1:]
-        for dir, _, files in os.walk(sources_dir):
-            media_list = []
-            for f in files:
-                if splashscreen:
-                    msg = f"Generating playlists...\n\n{dir}"
-                    splashscreen.showMessage(
-                        msg, Qt.AlignVCenter | Qt.AlignHCenter, Qt.white
+        media_list = []
+        for f_fqp, modified, length, details in resolved:
+            f_rp = f_fqp.rpartition(f"{sources_dir}")[2].replace("/", "\\")
+            media_list.append(
+                [
+                    f"..\\{sd_relative}{f_rp}",
+                    modified,
+                    details,
+                    length,
+                ]
+            )
+        # sort descending from most recent
+        media_list.sort(key=lambda m: float(m[1]), reverse=True)
+        return media_list
+
+    @staticmethod
+    def _station(playlists_dir, sources_dir, dir):
+        # the station, i.e. sources subfolder, a folder's playlists are
+        # named after
+        common_root = playlists_dir.rpartition("/")[0]
+        sd_relative = sources_dir.partition(common_root)[2][1:]
+        dir_rp = dir.rpartition(f"{common_root}/{sd_relative}")
+        if platform.system() == "Windows":
+            sep = "\\"
+        else:
+            sep = "/"
+        return dir_rp[2].split(sep)[1]
+
+    @staticmethod
+    def _write_station(
+        playlists_dir, sources_dir, dir, media_list, options, indexes=()
+    ):
+        # indexes are SearchIndex and/or FacetIndex
+        source = __class__._station(playlists_dir, sources_dir, dir)
+        shards = list(__class__._shard(source, media_list, options))
+        for index in indexes:
+            index.remove_station(source)
+            for name, shard in shards:
+                index.add(f"{name}.pls", source, shard)
+        generated = []
+        for name, shard in shards:
+            newest = max(float(m[1]) for m in shard)
+            fn, written = __class__._generate_playlist(
+                playlists_dir, name, shard
+            )
+            generated.append((fn, written, newest))
+        return generated
+
+    @staticmethod
+    def _generate_folder(
+        playlists_dir,
+        sources_dir,
+        dir,
+        media,
+        cache,
+        options,
+        indexes,
+        quarantined=None,
+    ):
+        resolved = __class__._resolve_probes(
+            media, cache, options, quarantined
+        )
+        media_list = __class__._sorted_media_list(
+            playlists_dir, sources_dir, resolved
+        )
+        return __class__._write_station(
+            playlists_dir, sources_dir, dir, media_list, options, indexes
+        )
+
+    @staticmethod
+    def _record(summary, generated):
+        for fn, written, newest in generated:
+            if written:
+                summary.written.append(fn)
+            else:
+                summary.unchanged.append(fn)
+            summary.newest[fn] = newest
+
+    @staticmethod
+    def _prune_playlists(playlists_dir, summary):
+        # only called after a complete walk of the sources folder
+        generated = set(summary.written) | set(summary.unchanged)
+        with os.scandir(playlists_dir) as it:
+            stale = sorted(
+                e.name
+                for e in it
+                if e.name.endswith(".pls")
+                and e.is_file()
+                and e.name not in generated
+            )
+        for fn in stale:
+            os.remove(f"{playlists_dir}/{fn}")
+            summary.removed.append(fn)
+
+    @staticmethod
+    def _remove_station_playlists(
+        playlists_dir, station, generated, summary, indexes
+    ):
+        # removes a station's playlists, whole or sharded, other than
+        # those just generated, e.g. shards it no longer fills or all of
+        # them once its folder has no recordings
+        playlist = re.compile(
+            rf"{re.escape(station)}( - \d{{4}}(-\d\d)?)?( - p\d{{3}})?\.pls"
+        )
+        with os.scandir(playlists_dir) as it:
+            stale = sorted(
+                e.name
+                for e in it
+                if playlist.fullmatch(e.name)
+                and e.is_file()
+                and e.name not in generated
+            )
+        for fn in stale:
+            os.remove(f"{playlists_dir}/{fn}")
+            summary.removed.append(fn)
+        for index in indexes:
+            index.remove(stale)
+
+    @staticmethod
+    def _stamp_playlists(playlists_dir, summary):
+        stamps = PlaylistStamps(playlists_dir)
+        stamps.load()
+        stamps.update(summary.newest)
+        stamps.remove(summary.removed)
+        stamps.save()
+
+    @staticmethod
+    def _indexes(playlists_dir, options, load=False):
+        indexes = []
+        if options.search_index:
+            indexes.append(SearchIndex(playlists_dir))
+        if options.facet_index or options.composer_playlists:
+            indexes.append(FacetIndex(playlists_dir))
+        if load:
+            for index in indexes:
+                index.load()
+        return indexes
+
+    @staticmethod
+    def _save_indexes(indexes, options, summary):
+        for index in indexes:
+            if isinstance(index, FacetIndex) and options.composer_playlists:
+                __class__._write_composer_playlists(
+                    options.composer_playlists, index, options, summary
+                )
+            index.save()
+
+    @staticmethod
+    def _write_composer_playlists(composers_dir, facets, options, summary):
+        # a playlist per composer across all stations, in a folder of
+        # their own, sharded as station playlists
+        generated = set()
+        for composer, media_list in facets.composer_media():
+            name = re.sub(r'[\\/:*?"<>|]', "_", composer).strip(". ")
+            for shard_name, shard in __class__._shard(
+                name, media_list, options
+            ):
+                fn, written = __class__._generate_playlist(
+                    composers_dir, shard_name, shard
+                )
+                generated.add(fn)
+                summary.composers.append(fn)
+        with os.scandir(composers_dir) as it:
+            stale = [
+                e.name
+                for e in it
+                if e.name.endswith(".pls")
+                and e.is_file()
+                and e.name not in generated
+            ]
+        for fn in stale:
+            os.remove(f"{composers_dir}/{fn}")
+
+    @staticmethod
+    def generate_playlists(
+        playlists_dir, sources_dir, progress=None, options=None
+    ):
+        # progress, if given, is called with a stage and a folder
+        if options is None:
+            options = __class__.Options()
+        cache = options.cache
+        summary = __class__.Summary()
+        # rebuilt from scratch, so only this run's playlists are indexed
+        indexes = __class__._indexes(playlists_dir, options)
+        walker = TreeWalker(options.workers)
+        executor = __class__._create_executor(options)
+        try:
+            # walk first, submitting each mediafile for probing as it is
+            # found, then collect results in walk order so that output
+            # is identical whether or not probing is concurrent
+            pending = []
+            for dir, _, files in walker.walk(sources_dir):
+                if progress:
+                    progress("Scanning mediafiles...", dir)
+                media = __class__._scan_folder(
+                    dir, files, walker, cache, executor, options
+                )
+                if media != []:
+                    pending.append((dir, media))
+            summary.folders_listed = walker.listings
+            summary.stat_calls = walker.stat_calls
+            copies = set()
+            if options.find_duplicates or options.unique:
+                if progress:
+                    progress("Finding duplicates...", sources_dir)
+                duplicates = DuplicateFinder(playlists_dir)
+                copies = duplicates.find(
+                    sources_dir, pending, cache, options.workers
+                )
+                summary.duplicates = duplicates.groups
+                summary.unfingerprinted = duplicates.skipped
+                duplicates.save()
+            for dir, media in pending:
+                if options.unique:
+                    media = [m for m in media if m[0] not in copies]
+                    if media == []:
+                        continue
+                if progress:
+                    progress("Generating playlists...", dir)
+                __class__._record(
+                    summary,
+                    __class__._generate_folder(
+                        playlists_dir,
+                        sources_dir,
+                        dir,
+                        media,
+                        cache,
+                        options,
+                        indexes,
+                        summary.quarantined,
+                    ),
+                )
+        finally:
+            if executor:
+                # probes that missed their deadline were already killed
+                executor.shutdown(cancel_futures=True)
+        if options.prune:
+            __class__._prune_playlists(playlists_dir, summary)
+        __class__._stamp_playlists(playlists_dir, summary)
+        __class__._save_indexes(indexes, options, summary)
+        if cache:
+            cache.prune(sources_dir)
+            cache.save()
+        return summary
+
+    @staticmethod
+    def generate_folders(
+        playlists_dir,
+        sources_dir,
+        folders,
+        progress=None,
+        options=None,
+        indexes=None,
+    ):
+        # regenerate the playlists of just the given source folders.
+        # indexes, if given, are those of an earlier call, kept loaded
+        # rather than loaded again
+        if options is None:
+            options = __class__.Options()
+        cache = options.cache
+        summary = __class__.Summary()
+        if indexes is None:
+            indexes = __class__._indexes(playlists_dir, options, load=True)
+        copies = set()
+        if options.unique:
+            # new copies are only found by the next full run
+            duplicates = DuplicateFinder(playlists_dir)
+            duplicates.load()
+            copies = duplicates.copies(sources_dir)
+        stations = os.path.normpath(sources_dir)
+        walker = TreeWalker()
+        executor = __class__._create_executor(options)
+        try:
+            for dir in folders:
+                try:
+                    with os.scandir(dir) as it:
+                        files = [e for e in it if not e.is_dir()]
+                    summary.folders_listed += 1
+                except OSError:
+                    # the folder is gone
+                    files = []
+                media = __class__._scan_folder(
+                    dir, files, walker, cache, executor, options
+                )
+                media = [m for m in media if m[0] not in copies]
+                generated = []
+                if media != []:
+                    if progress:
+                        progress("Generating playlists...", dir)
+                    generated = __class__._generate_folder(
+                        playlists_dir,
+                        sources_dir,
+                        dir,
+                        media,
+                        cache,
+                        options,
+                        indexes,
+                        summary.quarantined,
                     )
-                    QApplication.processEvents()
-                if f.endswith(__class__.media_types):
-                    f_fqp = f"{dir}/{f}"
-                    modified = os.path.getmtime(f_fqp)
-                    duration = MediaInfo.parse(f_fqp, output="Audio;%Duration%")
-                    if duration != "":
-                        length = f"{round(float(duration) / 1000)}"
-                    else:
-                        length = "0"
-                    f_rp = f_fqp.rpartition(f"{sources_dir}")[2].replace("/", "\\")
-                    f_txt = f"{dir}/{f.rpartition('.')[0]}.txt"
-                    if os.path.exists(f_txt):
-                        with open(f_txt, encoding="latin-1") as f:
-                            d = f.read()
-                        details = re.sub(r"\s*[\r\n]+", " | ", d)
-                    else:
-                        details = f
-                    media_list.append(
-                        [
-                            f"..\\{sd_relative}{f_rp}",
-                            modified,
-                            details,
-                            length,
-                        ]
+                    __class__._record(summary, generated)
+                # a station's playlists are named after its folder, so
+                # only that folder's playlists are known to be stale
+                if os.path.normpath(os.path.dirname(dir)) == stations:
+                    __class__._remove_station_playlists(
+                        playlists_dir,
+                        __class__._station(playlists_dir, sources_dir, dir),
+                        {fn for fn, _, _ in generated},
+                        summary,
+                        indexes,
                     )
-            if media_list != []:
-                # sort descending from most recent
-                media_list.sort(key=lambda m: float(m[1]), reverse=True)
-                dir_rp = dir.rpartition(f"{common_root}/{sd_relative}")
-                if platform.system() == "Windows":
-                    sep = "\\"
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        summary.stat_calls = walker.stat_calls
+        __class__._stamp_playlists(playlists_dir, summary)
+        __class__._save_indexes(indexes, options, summary)
+        if cache:
+            cache.save()
+        return summary
+
+
+class PlaylistWatcher:
+    # Regenerates a station's playlist soon after its recordings change.
+    # Bursts of events, e.g. a mediafile and its sidecar arriving
+    # together, are debounced: a folder is only regenerated once it has
+    # been quiet for debounce seconds.
+    def __init__(
+        self,
+        playlists_dir,
+        sources_dir,
+        options,
+        progress=None,
+        debounce=2.0,
+        poll_interval=None,
+    ):
+        self.playlists_dir = playlists_dir
+        self.sources_dir = sources_dir
+        self.options = options
+        self.progress = progress
+        self.debounce = debounce
+        suffixes = PlaylistGenerator.media_types + (".txt",)
+        if poll_interval is None and InotifyWatch.available():
+            self.watch = InotifyWatch(suffixes)
+        else:
+            self.watch = PollingWatch(suffixes, poll_interval or 10.0)
+
+    def run(self):
+        PlaylistGenerator.generate_playlists(
+            self.playlists_dir, self.sources_dir, self.progress, self.options
+        )
+        # loaded once, then kept up to date by generate_folders
+        indexes = PlaylistGenerator._indexes(
+            self.playlists_dir, self.options, load=True
+        )
+        for dir, _, _ in os.walk(self.sources_dir):
+            self.watch.add(dir)
+        due = {}
+        try:
+            while True:
+                if due:
+                    timeout = max(0, min(due.values()) - time.monotonic())
                 else:
-                    sep = "/"
-                source = dir_rp[2].split(sep)[1]
-                __class__._generate_playlist(playlists_dir, source, media_list)
-        return True
+                    timeout = None
+                changed = self.watch.changes(timeout)
+                now = time.monotonic()
+                if changed is None:
+                    # events were lost, so start afresh
+                    due.clear()
+                    PlaylistGenerator.generate_playlists(
+                        self.playlists_dir,
+                        self.sources_dir,
+                        self.progress,
+                        self.options,
+                    )
+                    indexes = PlaylistGenerator._indexes(
+                        self.playlists_dir, self.options, load=True
+                    )
+                    continue
+                for dir in changed:
+                    due[dir] = now + self.debounce
+                ready = sorted(d for d, t in due.items() if t <= now)
+                for dir in ready:
+                    del due[dir]
+                if ready:
+                    PlaylistGenerator.generate_folders(
+                        self.playlists_dir,
+                        self.sources_dir,
+                        ready,
+                        self.progress,
+                        self.options,
+                        indexes,
+                    )
+        finally:
+            self.watch.close()
 
 
-if __name__ == "__main__":
+class PlaylistVerifier:
+    # Checks that a folder of playlists still matches its mediafiles,
+    # e.g. after a move or rsync. Playlists are read concurrently, and
+    # the folders their entries refer to are each listed once, with the
+    # entries of a folder checked together against its listing.
+    # Mediafiles are missing if a playlist entry doesn't resolve, stale
+    # if modified after a playlist listing them was last generated, as
+    # its PlaylistStamps stamp or, failing that, its mtime say, and, if
+    # a sources folder is given, orphaned if no playlist lists them.
+
+    @dataclass
+    class Report:
+        playlists: int = 0
+        entries: int = 0
+        # (playlist file name, File<n> value)
+        missing: list = field(default_factory=list)
+        stale: list = field(default_factory=list)
+        # mediafile paths
+        orphaned: list = field(default_factory=list)
+
+    def __init__(self, playlists_dir, sources_dir=None, workers=1):
+        self.playlists_dir = playlists_dir
+        self.sources_dir = sources_dir
+        self.workers = max(1, workers)
+        self.stamps = PlaylistStamps(playlists_dir)
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.normpath(path))
+
+    def _read(self, fn):
+        fqp = f"{self.playlists_dir}/{fn}"
+        generated = max(
+            os.stat(fqp).st_mtime, self.stamps.playlists.get(fn, 0)
+        )
+        return fn, generated, pls.read_playlist(fqp)
+
+    @staticmethod
+    def _list(dir):
+        # returns {normcased name: DirEntry} for a folder's files
+        try:
+            with os.scandir(dir) as it:
+                return {
+                    os.path.normcase(e.name): e for e in it if not e.is_dir()
+                }
+        except OSError:
+            return {}
+
+    @staticmethod
+    def _check(files, refs, orphans):
+        # checks one folder's referenced names against its listing,
+        # returns (missing, stale, orphaned)
+        missing = []
+        stale = []
+        for name, listed in refs.items():
+            entry = files.get(name)
+            if entry is None:
+                missing.extend((fn, file) for fn, file, _ in listed)
+                continue
+            try:
+                modified = entry.stat().st_mtime
+            except OSError:
+                missing.extend((fn, file) for fn, file, _ in listed)
+                continue
+            stale.extend(
+                (fn, file)
+                for fn, file, written in listed
+                if modified > written
+            )
+        orphaned = []
+        if orphans:
+            orphaned = [
+                e.path
+                for name, e in files.items()
+                if name not in refs
+                and e.name.endswith(PlaylistGenerator.media_types)
+            ]
+        return missing, stale, orphaned
+
+    def _check_folder(self, dir, refs):
+        return self._check(self._list(dir), refs, False)
+
+    def verify(self, progress=None):
+        report = __class__.Report()
+        self.stamps.load()
+        with os.scandir(self.playlists_dir) as it:
+            playlists = sorted(
+                e.name
+                for e in it
+                if e.name.endswith(".pls")
+                and not e.name.startswith(".")
+                and e.is_file()
+            )
+        report.playlists = len(playlists)
+        # {folder key: (folder, {normcased name: [(playlist, file,
+        # playlist generated time)]})}
+        refs = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for fn, written, entries in executor.map(self._read, playlists):
+                if progress:
+                    progress("Reading playlists...", fn)
+                for file, _, _ in entries:
+                    if file == PlaylistGenerator.dummy_item[0]:
+                        continue
+                    report.entries += 1
+                    path = os.path.join(
+                        self.playlists_dir, file.replace("\\", "/")
+                    )
+                    dir, name = os.path.split(os.path.normpath(path))
+                    folder = refs.setdefault(self._key(dir), (dir, {}))
+                    folder[1].setdefault(os.path.normcase(name), []).append(
+                        (fn, file, written)
+                    )
+            # folders below the sources folder are listed as it is
+            # walked, so that their orphans are found, then any others
+            # referenced
+            checks = []
+            if self.sources_dir:
+                walker = TreeWalker(self.workers)
+                for dir, _, files in walker.walk(self.sources_dir):
+                    if progress:
+                        progress("Checking mediafiles...", dir)
+                    listing = {os.path.normcase(e.name): e for e in files}
+                    folder = refs.pop(self._key(dir), (dir, {}))
+                    checks.append(
+                        executor.submit(self._check, listing, folder[1], True)
+                    )
+            for dir, names in refs.values():
+                checks.append(executor.submit(self._check_folder, dir, names))
+            for check in checks:
+                missing, stale, orphaned = check.result()
+                report.missing += missing
+                report.stale += stale
+                report.orphaned += orphaned
+        report.missing.sort()
+        report.stale.sort()
+        report.orphaned.sort()
+        return report
+
+
+PARENT_ERROR = (
+    "Playlists folder and sources folder must share the same parent.\n\n"
+    "(This is because playlist media paths will be written\n"
+    "relative to the playlists folder so that the parent tree\n"
+    "can be easily moved or copied to one of your other devices.)"
+)
+
+
+def run_gui(root, options):
+    # Qt is only imported when the file pickers are actually used
+    from PySide6.QtCore import Qt
+    from PySide6.QtGui import QPixmap
+    from PySide6.QtWidgets import (
+        QApplication,
+        QFileDialog,
+        QMessageBox,
+        QSplashScreen,
+    )
+
+    def folder_dialog(title):
+        fd = QFileDialog()
+        fd.setWindowTitle(title)
+        fd.setFileMode(QFileDialog.Directory)
+        fd.setDirectory(root)
+        if QApplication.platformName() == "cocoa":
+            fd.setOption(QFileDialog.DontUseNativeDialog)
+        return fd
+
     app = QApplication()
-    if len(sys.argv) > 1:
-        root = sys.argv[1]
-    else:
-        root = os.path.expanduser("~")
     err_msg = None
-    fd = FolderDialog("Choose mediafile sources folder", root)
-    if QApplication.platformName() == "cocoa":
-        fd.setOption(QFileDialog.DontUseNativeDialog)    
+    fd = folder_dialog("Choose mediafile sources folder")
     if fd.exec():
         sf = fd.selectedFiles()[0]
-        fd = FolderDialog("Choose destination folder for playlists", root)
-        if QApplication.platformName() == "cocoa":
-            fd.setOption(QFileDialog.DontUseNativeDialog)
+        fd = folder_dialog("Choose destination folder for playlists")
         if fd.exec():
             pf = fd.selectedFiles()[0]
-            sf_parent = os.path.abspath(os.path.join(sf, os.pardir))
-            pf_parent = os.path.abspath(os.path.join(pf, os.pardir))
-            if sf_parent == pf_parent:
+            cf = options.composer_playlists
+            if PlaylistGenerator.share_parent(sf, pf) and (
+                not cf or PlaylistGenerator.share_parent(sf, cf)
+            ):
                 pm = QPixmap(1000, 300)
                 pm.fill(Qt.gray)
                 ss = QSplashScreen(pm, Qt.WindowStaysOnTopHint)
                 ss.setStyleSheet("font-weight: bold;")
                 ss.show()
                 app.processEvents()
-                PlaylistGenerator.generate_playlists(pf, sf, ss)
-            else:
-                err_msg = (
-                    "\nCannot continue.\n\nPlaylists folder "
-                    "and sources folder must share the same parent.\n\n"
-                    "(This is because playlist media paths will be written\n"
-                    "relative to the playlists folder so that the parent tree\n"
-                    "can be easily moved or copied "
-                    "to one of your other devices.)"
+
+                def show_progress(stage, dir):
+                    ss.showMessage(
+                        f"{stage}\n\n{dir}",
+                        Qt.AlignVCenter | Qt.AlignHCenter,
+                        Qt.white,
+                    )
+                    app.processEvents()
+
+                PlaylistGenerator.generate_playlists(
+                    pf, sf, show_progress, options
                 )
+            else:
+                err_msg = f"\nCannot continue.\n\n{PARENT_ERROR}"
         else:
             err_msg = (
                 "\nCannot continue.\n\n"
@@ -181,3 +2032,303 @@ if __name__ == "__main__":
         QMessageBox(
             QMessageBox.Critical, "Playlist Generator - Error", err_msg
         ).exec()
+        return 1
+    return 0
+
+
+def run_headless(sources_dir, playlists_dir, options, quiet=False, watch=None):
+    # forward slashes throughout, as returned by the Qt file pickers
+    sf = os.path.abspath(sources_dir).replace(os.sep, "/")
+    pf = os.path.abspath(playlists_dir).replace(os.sep, "/")
+    cf = options.composer_playlists
+    for folder in (sf, pf, cf):
+        if folder and not os.path.isdir(folder):
+            print(
+                f"Cannot continue. No such folder: {folder}", file=sys.stderr
+            )
+            return 1
+    if not PlaylistGenerator.share_parent(sf, pf) or (
+        cf and not PlaylistGenerator.share_parent(sf, cf)
+    ):
+        print(f"Cannot continue. {PARENT_ERROR}", file=sys.stderr)
+        return 1
+    if cf == pf:
+        print(
+            "Cannot continue. Composer playlists need a folder of their own.",
+            file=sys.stderr,
+        )
+        return 1
+
+    def show_progress(stage, dir):
+        print(f"{stage} {dir}", file=sys.stderr)
+
+    if watch:
+        watcher = PlaylistWatcher(
+            pf, sf, options, None if quiet else show_progress, **watch
+        )
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    summary = PlaylistGenerator.generate_playlists(
+        pf, sf, None if quiet else show_progress, options
+    )
+    if not quiet:
+        for label, fns in (
+            ("Written", summary.written),
+            ("Removed", summary.removed),
+        ):
+            for fn in fns:
+                print(f"{label} {fn}", file=sys.stderr)
+    # listed even when quiet, as their playlist entries have no length
+    for f_fqp, reason in summary.quarantined:
+        print(f"Quarantined {f_fqp}: {reason}", file=sys.stderr)
+    print(
+        f"Playlists: {len(summary.written)} written, "
+        f"{len(summary.unchanged)} unchanged, "
+        f"{len(summary.removed)} removed",
+        file=sys.stderr,
+    )
+    if cf:
+        print(
+            f"Composer playlists: {len(summary.composers)} in {cf}",
+            file=sys.stderr,
+        )
+    print(
+        f"Walk: {summary.folders_listed} folders listed, "
+        f"{summary.stat_calls} stat calls",
+        file=sys.stderr,
+    )
+    if options.cache:
+        stats = options.cache.stats()
+        print(
+            f"Probe cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['entries']} entries, "
+            f"{stats['quarantined']} quarantined",
+            file=sys.stderr,
+        )
+    if options.find_duplicates or options.unique:
+        copies = sum(len(g["copies"]) for g in summary.duplicates)
+        print(
+            f"Duplicates: {len(summary.duplicates)} recordings with "
+            f"{copies} copies, see {pf}/{DuplicateFinder.file_name}",
+            file=sys.stderr,
+        )
+        for f_fqp in summary.unfingerprinted:
+            print(f"Not fingerprinted {f_fqp}", file=sys.stderr)
+    return 0
+
+
+def run_verify(playlists_dir, sources_dir, workers, quiet=False):
+    pf = os.path.abspath(playlists_dir).replace(os.sep, "/")
+    sf = None
+    if sources_dir:
+        sf = os.path.abspath(sources_dir).replace(os.sep, "/")
+    for folder in (pf, sf):
+        if folder and not os.path.isdir(folder):
+            print(
+                f"Cannot continue. No such folder: {folder}", file=sys.stderr
+            )
+            return 1
+
+    def show_progress(stage, item):
+        print(f"{stage} {item}", file=sys.stderr)
+
+    report = PlaylistVerifier(pf, sf, workers).verify(
+        None if quiet else show_progress
+    )
+    for label, entries in (
+        ("Missing", report.missing),
+        ("Stale", report.stale),
+    ):
+        for fn, file in entries:
+            print(f"{label} {fn}: {file}", file=sys.stderr)
+    for path in report.orphaned:
+        print(f"Orphaned {path}", file=sys.stderr)
+    print(
+        f"Verified {report.playlists} playlists, {report.entries} entries: "
+        f"{len(report.missing)} missing, {len(report.stale)} stale"
+        + (f", {len(report.orphaned)} orphaned" if sf else ""),
+        file=sys.stderr,
+    )
+    return 1 if report.missing else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "playlist-generator",
+        description="Generate .pls playlists for recorded radio broadcasts. "
+        "Without --sources and --playlists, folders are chosen with file "
+        "pickers.",
+    )
+    parser.add_argument(
+        "root",
+        nargs="?",
+        default=os.path.expanduser("~"),
+        help="root folder for the file pickers",
+    )
+    parser.add_argument(
+        "-s", "--sources", help="mediafile sources folder (headless)"
+    )
+    parser.add_argument(
+        "-p", "--playlists", help="destination folder for playlists (headless)"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of concurrent mediafile probes (default: cpu count)",
+    )
+    parser.add_argument(
+        "--pool",
+        choices=("thread", "process"),
+        default="thread",
+        help="without a probe timeout, probe with a pool of threads or "
+        "processes (default: thread)",
+    )
+    parser.add_argument(
+        "--no-fast-probe",
+        action="store_true",
+        help="probe every mediafile with MediaInfo",
+    )
+    parser.add_argument(
+        "--probe-timeout",
+        type=float,
+        default=60.0,
+        metavar="SECONDS",
+        help="kill a mediafile's probe once it has run for SECONDS, "
+        "listing it with a length of 0 and quarantining it; probes then "
+        "run in worker processes (default: 60, 0 to wait indefinitely)",
+    )
+    parser.add_argument(
+        "--cache-file",
+        help=f"probe cache file (default: {ProbeCache.default_path()})",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't use the probe cache"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="forget all cached probes before generating playlists",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=0,
+        metavar="BYTES",
+        help="split station playlists larger than BYTES, e.g. "
+        f"{pls.KODI_MAX_FILE_LENGTH}, the most kodi will load",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=("year", "month"),
+        help="split station playlists by year or month of recording",
+    )
+    parser.add_argument(
+        "--no-search-index",
+        action="store_true",
+        help=f"don't write {SearchIndex.file_name} alongside the playlists",
+    )
+    parser.add_argument(
+        "--facet-index",
+        action="store_true",
+        help=f"also write {FacetIndex.file_name} alongside the playlists",
+    )
+    parser.add_argument(
+        "--composer-playlists",
+        metavar="FOLDER",
+        help="also write a playlist per composer to FOLDER, which must "
+        "share the playlists folder's parent",
+    )
+    parser.add_argument(
+        "--find-duplicates",
+        action="store_true",
+        help="report copies of the same recording in "
+        f"{DuplicateFinder.file_name} alongside the playlists",
+    )
+    parser.add_argument(
+        "--unique",
+        action="store_true",
+        help="list each recording once, leaving out later copies "
+        "(implies --find-duplicates)",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="remove playlists whose source folder no longer has "
+        "mediafiles (headless)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running, regenerating a station's playlist "
+        "when its recordings change (headless)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="seconds a folder must be quiet before its playlist is "
+        "regenerated (default: 2)",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        metavar="SECONDS",
+        help="watch by polling every SECONDS instead of using inotify",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="check that every playlist entry resolves, reporting missing "
+        "and stale mediafiles, and, with --sources, orphaned ones "
+        "(headless, exits with 1 if any are missing)",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="don't report progress"
+    )
+    args = parser.parse_args()
+    options = PlaylistGenerator.Options(
+        workers=args.workers,
+        pool=args.pool,
+        fast_probe=not args.no_fast_probe,
+        probe_timeout=args.probe_timeout or None,
+        prune=args.prune,
+        shard_size=args.shard_size,
+        shard_by=args.shard_by,
+        search_index=not args.no_search_index,
+        facet_index=args.facet_index,
+        find_duplicates=args.find_duplicates,
+        unique=args.unique,
+    )
+    if args.composer_playlists:
+        # forward slashes, as the other folders
+        options.composer_playlists = os.path.abspath(
+            args.composer_playlists
+        ).replace(os.sep, "/")
+    if not args.no_cache:
+        options.cache = ProbeCache(args.cache_file)
+        if args.clear_cache:
+            options.cache.invalidate()
+    if args.watch and not args.sources:
+        parser.error("--watch needs --sources and --playlists")
+    if args.verify:
+        if not args.playlists:
+            parser.error("--verify needs --playlists")
+        rc = run_verify(args.playlists, args.sources, args.workers, args.quiet)
+    elif args.sources or args.playlists:
+        if not (args.sources and args.playlists):
+            parser.error("--sources and --playlists must be given together")
+        if args.watch:
+            watch = {"debounce": args.debounce, "poll_interval": args.poll}
+        else:
+            watch = None
+        rc = run_headless(
+            args.sources, args.playlists, options, args.quiet, watch
+        )
+    else:
+        rc = run_gui(args.root, options)
+    sys.exit(rc)
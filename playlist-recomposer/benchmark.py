@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+
+# Benchmarks playlist-recomposer's catalogue search over synthetic
+# playlists.
+#
+# Playlists are written as playlist-generator writes them, with titles
+# made of scraped-looking broadcast details, some with catalogue
+# numbers. The search is timed serially and with each given number of
+# worker processes, each repeated, and the best time kept. The works
+# found are checked to be the same whatever the number of workers.
+# The match cache is timed filling, unchanged and after a broadcast is
+# added to one playlist, the works found being checked to be the same.
+# The memory the works found take, at peak, and the time to sort them
+# and remove duplicates are measured. Catalogue playlists are written,
+# split at a given size, and checked to be no larger, not to split a
+# catalogue number that fits in one and to be as full as they can be.
+# A work in a playlist's last entry is checked to be found.
+# The works are sorted under a memory budget, spilling sorted runs to
+# temporary files, also from a warm match cache and with a smaller
+# budget whose runs are merged in passes, and checked to merge to the
+# works sorted in memory.
+# The catalogue parser is checked against the regexes it replaces on
+# the same titles, any given playlists' titles and titles on which the
+# regexes backtrack, and both are timed on them. The catalogues' parsers
+# compiled into one matcher are checked to find what they find
+# separately, and both are timed. Results are printed as JSON so that
+# runs can be compared.
+
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+spec = importlib.util.spec_from_file_location(
+    "playlist_recomposer",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "playlist-recomposer.py"
+    ),
+)
+playlist_recomposer = importlib.util.module_from_spec(spec)
+# so that worker processes can find the module's functions
+sys.modules[spec.name] = playlist_recomposer
+spec.loader.exec_module(playlist_recomposer)
+PlaylistRecomposer = playlist_recomposer.PlaylistRecomposer
+pls = playlist_recomposer.pls
+CATALOGUE_NUM, FILE, TITLE, LENGTH = (
+    PlaylistRecomposer.Columns.CATALOGUE_NUM,
+    PlaylistRecomposer.Columns.FILE,
+    PlaylistRecomposer.Columns.TITLE,
+    PlaylistRecomposer.Columns.LENGTH,
+)
+
+WORKS = (
+    "Beethoven: Piano Concerto No. 5 in E flat, Op. 73 'Emperor'",
+    "Bach: Magnificat in D, BWV. 243",
+    "Bach: Partita No. 2 in D minor, BWV 1004/5",
+    "Mozart: Symphony No. 41 in C, K. 551 'Jupiter'",
+    "Mozart: Piano Concerto No. 23 in A, KV 488",
+    "Schubert: Fantasy in C, D. 760 'Wanderer'",
+    "Haydn: Piano Sonata in C minor, Hob.XVI/20",
+    "Haydn: Symphony No. 104 in D, Hob. I:104 'London'",
+    "Chopin: Nocturne in E flat, Op. 9 No. 2",
+    "Brahms: Chorale Preludes, op. posth. 122 Nr. 3",
+    "Vivaldi: Violin Concerto in F minor 'Winter', RV 297",
+    "Handel: Water Music, Suite No. 1 in F, HWV 348",
+    "Bartók: Concerto for Orchestra, Sz. 116, BB 123",
+    "C.P.E. Bach: Cello Concerto in A, Wq. 172",
+    "Scarlatti: Keyboard Sonata in E, L. 23",
+    "Dvorak: Symphony No. 9 in E minor 'From the New World'",
+    "Sibelius: Tapiola",
+)
+PERFORMERS = (
+    "BBC Symphony Orchestra | Sakari Oramo (conductor)",
+    "Mitsuko Uchida (piano)",
+    "Berliner Philharmoniker | Kirill Petrenko (conductor)",
+    "Academy of Ancient Music | Laurence Cummings (director)",
+)
+# titles on which the regexes backtrack, the first exponentially
+BACKTRACKING = (
+    "Op posth. " * 14,
+    "Brahms: Op. posth" + ", ." * 500,
+    "op" * 1000,
+    "BWV " + " / -" * 500,
+    "Hob. " + ":/ ." * 500,
+)
+
+
+def build_playlists(root, playlists, entries, seed=0):
+    # returns the playlist paths
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for p in range(playlists):
+        fn = f"{root}/Station {p:03d}.pls"
+        titles = (
+            " | ".join(
+                rng.sample(WORKS, rng.randint(1, 4)) + [rng.choice(PERFORMERS)]
+            )
+            for _ in range(entries)
+        )
+        pls.write_playlist(
+            fn,
+            (
+                (
+                    f"..\\Stations\\Station {p:03d}\\broadcast-{i:05d}.mp3",
+                    f"{i + 1:04d}.{title}",
+                    f"{rng.randint(600, 10800)}",
+                )
+                for i, title in enumerate(titles)
+            ),
+        )
+        paths.append(fn)
+    return paths
+
+
+def search(paths, workers, cache=None):
+    # returns the seconds taken and the works found
+    recomposer = PlaylistRecomposer.__new__(PlaylistRecomposer)
+    recomposer.playlists = paths
+    recomposer.workers = workers
+    recomposer.cache = cache
+    patterns = {
+        c: recomposer.select_parser(c) for c in PlaylistRecomposer.Catalogue
+    }
+    start = time.perf_counter()
+    works = recomposer.search_playlists(patterns)
+    t = time.perf_counter() - start
+    return t, {c.name: list(w) for c, w in works.items()}
+
+
+def cache_benchmark(paths, workers, cache_file):
+    results = {}
+    for run in ("cold", "unchanged", "one_changed"):
+        if run == "one_changed":
+            # a new broadcast in the first playlist
+            entries = pls.read_playlist(paths[0])
+            pls.write_playlist(paths[0], entries + entries[:1])
+        cache = PlaylistRecomposer.MatchCache(cache_file)
+        start = time.perf_counter()
+        _, works = search(paths, workers, cache)
+        cache.save()
+        t = time.perf_counter() - start
+        if works != search(paths, workers)[1]:
+            raise RuntimeError(f"{run} cache found different works")
+        results[run] = {"seconds": round(t, 6), **cache.stats()}
+    return results
+
+
+def works_benchmark(paths):
+    recomposer = PlaylistRecomposer.__new__(PlaylistRecomposer)
+    recomposer.playlists = paths
+    patterns = {
+        c: recomposer.select_parser(c) for c in PlaylistRecomposer.Catalogue
+    }
+    tracemalloc.start()
+    works = recomposer.search_playlists(patterns)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results = {
+        "works": sum(len(w) for w in works.values()),
+        "bytes": size,
+        "peak_bytes": peak,
+    }
+    for step in ("sort", "remove_duplicates"):
+        start = time.perf_counter()
+        for w in works.values():
+            getattr(w, step)()
+        results[f"{step}_seconds"] = round(time.perf_counter() - start, 6)
+    return results
+
+
+def spill_check(paths, budget, cache_file):
+    # sorts and removes duplicates from the works found with and without
+    # a memory budget, with it and the warm cache_file, and with a
+    # sixteenth of it and runs merged in passes of two, checking that
+    # they agree and returning the runs spilled and left for the last
+    # merge, the times taken and the peak memory used
+    results = {"budget_bytes": budget}
+    digests = {}
+    spilled = PlaylistRecomposer.SpilledWorks
+    default_fan_in = spilled.fan_in
+    for mode, memory_budget, fan_in, cache in (
+        ("memory", None, default_fan_in, None),
+        ("spilled", budget, default_fan_in, None),
+        (
+            "warm",
+            budget,
+            default_fan_in,
+            PlaylistRecomposer.MatchCache(cache_file),
+        ),
+        ("passes", budget // 16, 2, None),
+    ):
+        spilled.fan_in = fan_in
+        recomposer = PlaylistRecomposer.__new__(PlaylistRecomposer)
+        recomposer.playlists = paths
+        recomposer.memory_budget = memory_budget
+        recomposer.cache = cache
+        patterns = {
+            c: recomposer.select_parser(c)
+            for c in PlaylistRecomposer.Catalogue
+        }
+        tracemalloc.start()
+        start = time.perf_counter()
+        works = recomposer.search_playlists(patterns)
+        for w in works.values():
+            w.sort()
+            w.remove_duplicates({})
+        # works are digested as they stream, so as not to hold them all
+        digest = hashlib.sha256()
+        for c, w in works.items():
+            for work in w:
+                digest.update(repr((c, work)).encode())
+        digests[mode] = digest.hexdigest()
+        t = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[f"{mode}_seconds"] = round(t, 6)
+        results[f"{mode}_peak_bytes"] = peak
+        if cache:
+            results[f"{mode}_hits"] = cache.hits
+        if memory_budget:
+            results[f"{mode}_runs"] = sum(w.spills for w in works.values())
+            results[f"{mode}_final_runs"] = max(
+                len(w.runs) for w in works.values()
+            )
+            for w in works.values():
+                w.close()
+    spilled.fan_in = default_fan_in
+    for mode, digest in digests.items():
+        if digest != digests["memory"]:
+            raise RuntimeError(f"{mode} works differ from those in memory")
+    return results
+
+
+def entries_length(works, n=1):
+    # bytes taken by works written as entries n onwards
+    return sum(
+        pls.entry_length(n + i, w[FILE], w[TITLE], w[LENGTH])
+        for i, w in enumerate(works)
+    )
+
+
+def chunk_check(paths, folder, max_length):
+    # returns the catalogue playlists written and their mean size
+    recomposer = PlaylistRecomposer.__new__(PlaylistRecomposer)
+    recomposer.playlists = paths
+    recomposer.destination_folder = folder
+    recomposer.KODI_MAX_FILE_LENGTH = max_length
+    patterns = {
+        c: recomposer.select_parser(c) for c in PlaylistRecomposer.Catalogue
+    }
+    sizes = []
+    for c, works in recomposer.search_playlists(patterns).items():
+        works.sort()
+        works.remove_duplicates()
+        fnames = recomposer.write_playlists(
+            PlaylistRecomposer.catalogue_name(c), works
+        )
+        chunks = PlaylistRecomposer.plan_chunks(works, max_length)
+        for (start, end), fn in zip(chunks, fnames):
+            size = os.path.getsize(f"{folder}/{fn}")
+            n = end - start
+            if size != pls.envelope_length(n) + entries_length(
+                works[start:end]
+            ):
+                raise RuntimeError(f"{fn} is {size} bytes, not as planned")
+            if size > max_length:
+                raise RuntimeError(f"{fn} is over {max_length} bytes")
+            sizes.append(size)
+            if end == len(works):
+                continue
+            # the works of the next playlist's first catalogue number
+            cn = works[end][CATALOGUE_NUM]
+            first = end
+            while first > 0 and works[first - 1][CATALOGUE_NUM] == cn:
+                first -= 1
+            last = end
+            while last < len(works) and works[last][CATALOGUE_NUM] == cn:
+                last += 1
+            if first < end:
+                # split, so too many works for one playlist
+                if (
+                    first <= start
+                    and pls.envelope_length(last - first)
+                    + entries_length(works[first:last])
+                    > max_length
+                ):
+                    last = end + 1
+                else:
+                    raise RuntimeError(f"{fn} splits {works.key.name} {cn}")
+            if (
+                size
+                - pls.envelope_length(n)
+                + pls.envelope_length(n + last - end)
+                + entries_length(works[end:last], n + 1)
+                <= max_length
+            ):
+                raise RuntimeError(f"{fn} could take {works.key.name} {cn}")
+    return {
+        "max_length": max_length,
+        "playlists": len(sizes),
+        "mean_fill": round(sum(sizes) / len(sizes) / max_length, 4),
+    }
+
+
+def compare(titles):
+    # checks the parser finds what the regexes find in every title and
+    # returns the seconds each took
+    recomposer = PlaylistRecomposer.__new__(PlaylistRecomposer)
+    seconds = {"regex": 0, "parser": 0}
+    for c in PlaylistRecomposer.Catalogue:
+        matchers = {
+            "regex": recomposer.select_regex(c),
+            "parser": recomposer.select_parser(c),
+        }
+        for title in titles:
+            found = {}
+            for name, matcher in matchers.items():
+                start = time.perf_counter()
+                found[name] = matcher.findall(title)
+                seconds[name] += time.perf_counter() - start
+            if found["parser"] != found["regex"]:
+                raise RuntimeError(
+                    f"{c.name} parser found {found['parser']}, "
+                    f"regex {found['regex']} in {title!r}"
+                )
+    return seconds
+
+
+def parser_check(paths):
+    titles = [t for p in paths for _, t, _ in pls.read_playlist(p)]
+    results = {}
+    for corpus, t in (("titles", titles), ("backtracking", BACKTRACKING)):
+        seconds = compare(t)
+        results[corpus] = {
+            "titles": len(t),
+            "regex_seconds": round(seconds["regex"], 6),
+            "parser_seconds": round(seconds["parser"], 6),
+            "speedup": (
+                round(seconds["regex"] / seconds["parser"], 2)
+                if seconds["parser"] > 0
+                else None
+            ),
+        }
+    return results
+
+
+def last_entry_check(folder):
+    # checks that a work in a playlist's last entry is matched
+    fn = f"{folder}/Last Entry.pls"
+    pls.write_playlist(
+        fn,
+        (
+            (f"..\\Last\\broadcast-{i:05d}.mp3", f"{i + 1:04d}.{title}", "60")
+            for i, title in enumerate((WORKS[-1], WORKS[0]))
+        ),
+    )
+    parsers = {
+        c.value: PlaylistRecomposer.CatalogueParser(c)
+        for c in PlaylistRecomposer.Catalogue
+    }
+    matched, matches = PlaylistRecomposer.match_playlist(
+        fn, PlaylistRecomposer.CatalogueMatcher(parsers)
+    )
+    if [i for _, i, _ in matches] != [2]:
+        raise RuntimeError(f"last entry not matched, found {matches}")
+    return {"entries": 2, "matched": sorted(matched)}
+
+
+def matcher_check(paths):
+    # checks the combined matcher finds what the catalogues' parsers
+    # find separately in every title and times both
+    titles = [t for p in paths for _, t, _ in pls.read_playlist(p)]
+    parsers = {
+        c.value: PlaylistRecomposer.CatalogueParser(c)
+        for c in PlaylistRecomposer.Catalogue
+    }
+    matcher = PlaylistRecomposer.CatalogueMatcher(parsers)
+    start = time.perf_counter()
+    separate = [
+        [(v, g) for v, parser in parsers.items() for g in parser.findall(t)]
+        for t in titles
+    ]
+    separate_time = time.perf_counter() - start
+    start = time.perf_counter()
+    combined = [matcher.findall(t) for t in titles]
+    combined_time = time.perf_counter() - start
+    # the combined matches are in title order, each catalogue's being
+    # compared
+    order = {value: k for k, value in enumerate(parsers)}
+    for title, s, c in zip(titles, separate, combined):
+        if sorted(c, key=lambda m: order[m[0]]) != s:
+            raise RuntimeError(
+                f"combined matcher found {c}, parsers {s} in {title!r}"
+            )
+    return {
+        "catalogues": len(parsers),
+        "titles": len(titles),
+        "separate_seconds": round(separate_time, 6),
+        "combined_seconds": round(combined_time, 6),
+        "speedup": (
+            round(separate_time / combined_time, 2)
+            if combined_time > 0
+            else None
+        ),
+    }
+
+
+def benchmark(paths, entries, workers, repeat):
+    results = {}
+    expected = None
+    for w in workers:
+        best = None
+        for _ in range(repeat):
+            t, works = search(paths, w)
+            if expected is None:
+                expected = works
+            elif works != expected:
+                raise RuntimeError(f"{w} workers found different works")
+            best = t if best is None else min(best, t)
+        results[w] = best
+    serial = results[workers[0]]
+    return {
+        "matches": {c: len(w) for c, w in expected.items()},
+        "workers": {
+            f"{w}": {
+                "seconds": round(t, 6),
+                "entries_per_second": round(entries / t) if t > 0 else None,
+                "speedup": round(serial / t, 2) if t > 0 else None,
+            }
+            for w, t in results.items()
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "benchmark",
+        description="Benchmark playlist-recomposer's catalogue search",
+    )
+    parser.add_argument(
+        "--playlists", type=int, default=40, help="number of playlists"
+    )
+    parser.add_argument(
+        "--entries", type=int, default=2000, help="entries per playlist"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, os.cpu_count() or 1],
+        help="numbers of worker processes to compare, the first being "
+        "the baseline (default: 1 and cpu count)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per number of workers, the best is reported "
+        "(default: 3)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--max-playlist-size",
+        type=int,
+        default=65536,
+        help="bytes catalogue playlists are split at for the size checks "
+        "(default: 65536)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=1048576,
+        help="bytes of works sorted in memory for the spill check "
+        "(default: 1048576)",
+    )
+    parser.add_argument(
+        "--corpus",
+        help="folder of playlists whose titles the catalogue parser is "
+        "also checked against the regexes on",
+    )
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        paths = build_playlists(
+            tmp.replace(os.sep, "/"), args.playlists, args.entries, args.seed
+        )
+        build_time = time.perf_counter() - start
+        results = {
+            "playlists": {
+                "playlists": args.playlists,
+                "entries": args.playlists * args.entries,
+                "seed": args.seed,
+                "build_seconds": round(build_time, 3),
+            },
+            "repeat": args.repeat,
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        }
+        results.update(
+            benchmark(
+                paths,
+                args.playlists * args.entries,
+                args.workers,
+                args.repeat,
+            )
+        )
+        results["cache"] = cache_benchmark(
+            paths, args.workers[0], f"{tmp}/match-cache.json"
+        )
+        results["works"] = works_benchmark(paths)
+        os.makedirs(f"{tmp}/Catalogue Playlists")
+        results["chunks"] = chunk_check(
+            paths, f"{tmp}/Catalogue Playlists", args.max_playlist_size
+        )
+        results["last_entry"] = last_entry_check(tmp)
+        results["spill"] = spill_check(
+            paths, args.memory_budget, f"{tmp}/match-cache.json"
+        )
+        if args.corpus:
+            paths += sorted(glob.glob(f"{args.corpus}/*.pls"))
+        results["parser"] = parser_check(paths)
+        results["matcher"] = matcher_check(paths)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, mode="w") as f:
+            f.write(f"{output}\n")
+    print(output)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Checks how playlist-recomposer splits catalogue playlists at their
+# edges, without building a library: works whose playlist is exactly
+# the size limit, a byte over it, a catalogue number that exactly fills
+# a playlist, one too large for a playlist that is split to exactly
+# fill one, and a single entry larger than the limit. Each case's
+# playlists are written to a temporary folder and checked against
+# plan_chunks and chunk_works. Results are printed as JSON, and a
+# failed check raises.
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+
+spec = importlib.util.spec_from_file_location(
+    "playlist_recomposer",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "playlist-recomposer.py"
+    ),
+)
+playlist_recomposer = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = playlist_recomposer
+spec.loader.exec_module(playlist_recomposer)
+PlaylistRecomposer = playlist_recomposer.PlaylistRecomposer
+pls = playlist_recomposer.pls
+
+
+def work(catalogue_num, i, title="x"):
+    # a row as PlaylistWorks yields them
+    return (
+        catalogue_num,
+        "",
+        0,
+        f"..\\Stations\\Station\\broadcast-{i:05d}.mp3",
+        title,
+        "3600",
+    )
+
+
+def playlist_length(works):
+    return pls.envelope_length(len(works)) + sum(
+        PlaylistRecomposer.entry_length(w, n)
+        for n, w in enumerate(works, start=1)
+    )
+
+
+def padded(works, length):
+    # works with the last title padded so that, as one playlist, they
+    # are length bytes
+    padding = length - playlist_length(works)
+    if padding < 0:
+        raise ValueError(f"works already take {playlist_length(works)}")
+    last = works[-1]
+    return works[:-1] + [last[:4] + (last[4] + "x" * padding,) + last[5:]]
+
+
+def check(name, works, max_length, expected, folder):
+    # checks that works split into the expected [(start, end)] ranges,
+    # that chunk_works yields them and that each playlist, written,
+    # is as large as planned and, unless a single entry, within bounds
+    chunks = PlaylistRecomposer.plan_chunks(works, max_length)
+    if chunks != expected:
+        raise RuntimeError(f"{name}: planned {chunks}, not {expected}")
+    yielded = list(PlaylistRecomposer.chunk_works(works, max_length))
+    if yielded != [works[start:end] for start, end in chunks]:
+        raise RuntimeError(f"{name}: chunk_works differs from plan_chunks")
+    sizes = []
+    for k, chunk in enumerate(yielded):
+        fn = f"{folder}/{name} {k}.pls"
+        pls.write_playlist(fn, ((w[3], w[4], w[5]) for w in chunk))
+        size = os.path.getsize(fn)
+        if size != playlist_length(chunk):
+            raise RuntimeError(f"{name}: {fn} is {size} bytes, not planned")
+        if size > max_length and len(chunk) > 1:
+            raise RuntimeError(f"{name}: {fn} is {size} bytes")
+        sizes.append(size)
+    return {"chunks": chunks, "sizes": sizes}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check catalogue playlist splitting at its edges."
+    )
+    parser.add_argument(
+        "--max-playlist-size",
+        type=int,
+        default=PlaylistRecomposer.KODI_MAX_FILE_LENGTH,
+        metavar="BYTES",
+        help="split catalogue playlists at BYTES "
+        f"(default: {PlaylistRecomposer.KODI_MAX_FILE_LENGTH})",
+    )
+    args = parser.parse_args()
+    max_length = args.max_playlist_size
+    # a catalogue number per work
+    works = [work(n, n) for n in range(1, 11)]
+    results = {"max_length": max_length}
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = tmp.replace(os.sep, "/")
+        exact = padded(works, max_length)
+        results["exact"] = check("exact", exact, max_length, [(0, 10)], folder)
+        over = padded(works, max_length + 1)
+        results["one_byte_over"] = check(
+            "one byte over", over, max_length, [(0, 9), (9, 10)], folder
+        )
+        # a catalogue number exactly filling a playlist, then another
+        block = padded([work(1, i) for i in range(5)], max_length)
+        results["exact_catalogue_number"] = check(
+            "exact catalogue number",
+            block + [work(2, 5)],
+            max_length,
+            [(0, 5), (5, 6)],
+            folder,
+        )
+        # a catalogue number too large for a playlist, split by works,
+        # the first of which exactly fill one
+        split = padded([work(1, i) for i in range(9)], max_length)
+        results["split_catalogue_number"] = check(
+            "split catalogue number",
+            split + [work(1, 9)],
+            max_length,
+            [(0, 9), (9, 10)],
+            folder,
+        )
+        # an entry that can't fit in any playlist is one of its own
+        large = padded([work(2, 1)], max_length + 1000)
+        results["entry_over_limit"] = check(
+            "entry over limit",
+            [work(1, 0)] + large + [work(3, 2)],
+            max_length,
+            [(0, 1), (1, 2), (2, 3)],
+            folder,
+        )
+        results["single_entry_over_limit"] = check(
+            "single entry over limit", large, max_length, [(0, 1)], folder
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,89 @@
 #!/usr/bin/env python3
 
-import configparser
+import argparse
 import glob
+import hashlib
+import heapq
+import importlib.util
+import json
+import multiprocessing
 import os
+import pickle
 import platform
 import re
 import sys
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum, IntEnum
+from itertools import groupby, repeat
+from operator import attrgetter, itemgetter
 
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QPixmap
-from PySide6.QtWidgets import (
-    QApplication,
-    QCheckBox,
-    QFileDialog,
-    QGroupBox,
-    QLabel,
-    QListView,
-    QMessageBox,
-    QSplashScreen,
-    QSplitter,
-    QSplitterHandle,
-    QVBoxLayout,
+# pls is shared with playlist-generator
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
 )
+import pls  # noqa: E402
 
 
 class PlaylistRecomposer:
 
-    KODI_MAX_FILE_LENGTH = 1048576
+    # catalogue playlists are split to be at most this many bytes
+    KODI_MAX_FILE_LENGTH = pls.KODI_MAX_FILE_LENGTH
 
     playlists = None
-    pattern = None
+    splashscreen = None
+    # a MatchCache, or None to match every playlist
+    cache = None
+    # list copies of a recording once, see load_originals
+    merge_copies = False
+    # bytes of works to sort in memory, beyond which they are spilled to
+    # temporary files, see SpilledWorks, or None to sort all in memory
+    memory_budget = None
+    # workers > 1 matches playlists in a pool of processes
+    workers = 1
+    # report progress on stderr, without the splash screen
+    verbose = False
 
-    def __init__(self, root, key=None):
+    def __init__(
+        self,
+        root,
+        key=None,
+        workers=1,
+        cache=None,
+        merge_copies=False,
+        memory_budget=None,
+        playlists_folder=None,
+        destination_folder=None,
+        catalogues=None,
+        verbose=False,
+    ):
         super(PlaylistRecomposer, self).__init__()
-        if key:
-            self.key = key
-            self.select_regex(key)
-            self.search_playlists()
+        self.workers = workers
+        self.cache = cache
+        self.merge_copies = merge_copies
+        self.memory_budget = memory_budget
+        self.verbose = verbose
+        if playlists_folder or destination_folder:
+            # headless, the folders and catalogues being given
+            self.catalogues = catalogues or []
+            if not playlists_folder or not os.path.isdir(playlists_folder):
+                self.return_code = 1
+            elif not self.catalogues:
+                self.return_code = 2
+            elif not destination_folder or not os.path.isdir(
+                destination_folder
+            ):
+                self.return_code = 3
+            else:
+                self.return_code = self.check_folders(
+                    playlists_folder, destination_folder
+                )
+                if self.return_code == 0:
+                    self.catalogue_search()
+        elif key:
+            self.catalogues = [key]
+            self.catalogue_search()
         else:
             self.catalogue_chooser = self.FolderDialog(
                 "Choose catalogues and playlists folder to search",
@@ -55,39 +101,22 @@ class PlaylistRecomposer:
                         root
                     )
                     if self.destination_chooser.exec():
-                        self.destination_folder = (
-                            self.destination_chooser.selectedFiles()[0]
+                        self.return_code = self.check_folders(
+                            playlists_folder,
+                            self.destination_chooser.selectedFiles()[0],
                         )
-                        if self.destination_folder != playlists_folder:
-                            pf_parent = os.path.abspath(
-                                os.path.join(playlists_folder, os.pardir)
+                        if self.return_code == 0:
+                            pm = QPixmap(1000, 300)
+                            pm.fill(Qt.gray)
+                            self.splashscreen = QSplashScreen(
+                                pm, Qt.WindowStaysOnTopHint
                             )
-                            df_parent = os.path.abspath(
-                                os.path.join(self.destination_folder, os.pardir)
+                            self.splashscreen.setStyleSheet(
+                                "font-weight: bold;"
                             )
-                            if df_parent == pf_parent:
-                                self.playlists = glob.glob(
-                                    playlists_folder + "/*.pls"
-                                )
-                                if self.playlists:
-                                    pm = QPixmap(1000, 300)
-                                    pm.fill(Qt.gray)
-                                    self.splashscreen = QSplashScreen(
-                                        pm, Qt.WindowStaysOnTopHint
-                                    )
-                                    self.splashscreen.setStyleSheet(
-                                        "font-weight: bold;"
-                                    )
-                                    self.splashscreen.show()
-                                    QApplication.processEvents()
-                                    self.catalogue_search()
-                                    self.return_code = 0
-                                else:
-                                    self.return_code = 6
-                            else:
-                                self.return_code = 5
-                        else:
-                            self.return_code = 4
+                            self.splashscreen.show()
+                            QApplication.processEvents()
+                            self.catalogue_search()
                     else:
                         self.return_code = 3
                 else:
@@ -95,325 +124,750 @@ class PlaylistRecomposer:
             else:
                 self.return_code = 1
 
+    def check_folders(self, playlists_folder, destination_folder):
+        # returns 0, having set the playlists to search and the folder to
+        # write catalogue playlists to, if they can be, else the return
+        # code saying why not
+        self.destination_folder = destination_folder
+        if self.destination_folder == playlists_folder:
+            return 4
+        pf_parent = os.path.abspath(os.path.join(playlists_folder, os.pardir))
+        df_parent = os.path.abspath(
+            os.path.join(self.destination_folder, os.pardir)
+        )
+        if df_parent != pf_parent:
+            return 5
+        # sorted, so that works are listed in the same order everywhere
+        self.playlists = sorted(glob.glob(playlists_folder + "/*.pls"))
+        if not self.playlists:
+            return 6
+        return 0
+
     def on_chooser_finished(self):
         self.catalogues = (
             self.catalogue_chooser.catalogue_chooser.get_selections()
         )
 
     def catalogue_search(self):
+        # every playlist is read once, its titles being matched against
+        # all selected catalogues in the same pass
+        patterns = {
+            catalogue: self.select_parser(catalogue)
+            for catalogue in self.catalogues
+        }
+        works = self.search_playlists(patterns)
+        if self.cache:
+            self.cache.prune(self.playlists)
+            self.cache.save()
+        originals = None
+        if self.merge_copies:
+            originals = self.load_originals(os.path.dirname(self.playlists[0]))
         for catalogue in self.catalogues:
             self.key = catalogue
-            self.select_regex(catalogue)
-            self.search_playlists()
+            works[catalogue].sort()
+            works[catalogue].remove_duplicates(originals)
+            # nothing to write for a catalogue without matches
+            if works[catalogue]:
+                self.write_playlists(
+                    self.catalogue_name(catalogue), works[catalogue]
+                )
+            if self.memory_budget:
+                works[catalogue].close()
+
+    @staticmethod
+    def load_originals(playlists_folder):
+        # returns {copy: original} for the copies of recordings that
+        # playlist-generator's --find-duplicates reported in the playlists
+        # folder, paths being relative to the sources folder
+        try:
+            with open(
+                f"{playlists_folder}/.duplicates.json", encoding="utf-8"
+            ) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if report.get("version") != 1:
+            return {}
+        return {
+            copy: group["original"]
+            for group in report["groups"]
+            for copy in group["copies"]
+        }
+
+    @classmethod
+    def catalogue_name(cls, catalogue):
+        return cls.registry[catalogue.value]["name"]
+
+    def select_parser(self, key):
+        # matches titles as select_regex's pattern does, in linear time
+        return self.CatalogueParser(key)
 
     def select_regex(self, key):
+        # the catalogue grammar, as CatalogueParser implements it
         # TODO weed out matches that exceed the last work
         # in catalogue, e.g. opus posthumous (1830)
-        if key == self.Catalogue.OPUS:
-            self.pattern = re.compile(
-                r"\b(?:op|opus)+(?:\s|\.)*(?:posth.*?)*(?:[\s\.,])*(\d+)"
-                r"([a-z]?)(?:[\s\/.,-]*)(?:No|Nr|N\xB0)*(?:\s|\.)*(\d*)",
-                flags=re.IGNORECASE,
-            )
-        elif key == self.Catalogue.BWV:
-            self.pattern = re.compile(
-                r"\b(?:bwv)+(?:\s|\.)*(\d+)([a-z]?)(?:[\s/.,-]*)*(\d*)",
-                flags=re.IGNORECASE,
-            )
-        elif key == self.Catalogue.KOECHEL:
-            # TODO weed out Scarlatti Kirkpatrick No's
-            self.pattern = re.compile(
-                r"\b(?:k|kv)+(?:\s|\.)*(\d+)([a-z]?)(?:[\s/.,-]*)"
-                r"(?:No|Nr|N\xB0)*(?:\s|\.)*(\d*)",
-                flags=re.IGNORECASE,
-            )
-        elif key == self.Catalogue.DEUTSCH:
-            self.pattern = re.compile(
-                r"\b(?:d)+(?:\s|\.)*(\d+)([a-z]?)(?:[\s/.,-]*)"
-                r"(?:No|Nr|N\xB0)*(?:\s|\.)*(\d*)",
-                flags=re.IGNORECASE,
-            )
-        elif key == self.Catalogue.HOBOKEN:
-            # TODO weed out other 'H.' catalogues
-            # e.g. CPE Bach, Honegger, Martinu, Berlioz etc.
-            self.pattern = re.compile(
-                r"\b(?:h(?:ob)?[\s.]+)([XVI]+|\d+)([abc]?)"
-                r"(?:[\s/:.,]*)(?:n[or°]\.)*(?:\s|\.)*(\d*)",
-                flags=re.IGNORECASE,
-            )
+        # TODO weed out Scarlatti Kirkpatrick No's from Koechel and
+        # other 'H.' catalogues, e.g. CPE Bach, Honegger, Martinu,
+        # Berlioz etc., from Hoboken
+        entry = self.registry[key.value]
+        prefixes = "|".join(
+            re.escape(p)
+            for p in sorted(entry["prefixes"], key=len, reverse=True)
+        )
+        pattern = rf"\b(?:{prefixes})"
+        if entry.get("repeated", True):
+            pattern += "+"
+        if entry.get("separated", False):
+            pattern += r"[\s.]+"
+        else:
+            pattern += r"(?:\s|\.)*"
+        if entry.get("posthumous", False):
+            pattern += r"(?:posth.*?)*(?:[\s\.,])*"
+        if entry["numbering"] == "roman":
+            pattern += r"([XVI]+|\d+)"
+        else:
+            pattern += r"(\d+)"
+        pattern += f"([{re.escape(entry['suffixes'])}]?)"
+        pattern += rf"(?:[\s{re.escape(entry['piece_separators'])}]*)"
+        if entry["piece_markers"]:
+            markers = "|".join(re.escape(m) for m in entry["piece_markers"])
+            pattern += f"(?:{markers})*"
+        pattern += r"(?:\s|\.)*(\d*)"
+        return re.compile(pattern, flags=re.IGNORECASE)
 
-    def search_playlists(self):
-        works = self.PlaylistWorks(self.key)
-        for playlist in self.playlists:
-            catalogue_name = self.key.name
-            if catalogue_name != "BWV":
-                catalogue_name = catalogue_name.capitalize()
-            msg = (
-                f"Searching playlists for {catalogue_name} "
-                f"catalogue numbers...\n\n{playlist}"
-            )
+    def show_message(self, msg):
+        if self.splashscreen:
             self.splashscreen.showMessage(
                 msg, Qt.AlignVCenter | Qt.AlignHCenter, Qt.white
             )
             QApplication.processEvents()
-            pl = configparser.ConfigParser(interpolation=None)
-            pl.read_file(open(playlist, encoding="latin-1"))
-            n = pl["playlist"]["NumberOfEntries"]
-            for i in range(1, int(n)):
-                title = pl["playlist"][f"title{i}"]
-                matches = (self.pattern).finditer(title)
-                works.append_regex_matches(
-                    matches,
-                    self.key,
-                    pl["playlist"][f"file{i}"],
-                    title[5:],
-                    pl["playlist"][f"length{i}"],
+        elif self.verbose:
+            print(msg.replace("\n\n", " "), file=sys.stderr)
+
+    @staticmethod
+    def match_playlist(playlist, matcher):
+        # matches a playlist's titles with a CatalogueMatcher, and
+        # returns compact records, the matched entries as
+        # {entry number: (file, title, length)} and the matches as
+        # [(catalogue value, entry number, match groups)]
+        entries = pls.read_playlist(playlist)
+        matched = {}
+        matches = []
+        for i, (file, title, length) in enumerate(entries, 1):
+            for value, groups in matcher.findall(title):
+                matched[i] = (file, title[5:], length)
+                matches.append((value, i, groups))
+        return matched, matches
+
+    def search_playlists(self, patterns):
+        # returns {catalogue: PlaylistWorks} for {catalogue: parser},
+        # or SpilledWorks with a memory budget. The parsers are compiled
+        # into one CatalogueMatcher, so that titles are scanned once.
+        # Only playlists without cached matches are read. With
+        # workers > 1, they are matched in a process pool, and the
+        # results merged in playlist order, so that the works are the
+        # same either way.
+        if self.memory_budget:
+            # the catalogues share the budget, see spill_largest
+            works = {
+                catalogue: self.SpilledWorks(catalogue, self.memory_budget)
+                for catalogue in patterns
+            }
+        else:
+            works = {
+                catalogue: self.PlaylistWorks(catalogue)
+                for catalogue in patterns
+            }
+        catalogue_names = ", ".join(self.catalogue_name(c) for c in patterns)
+        patterns = {c.value: pattern for c, pattern in patterns.items()}
+        matcher = self.CatalogueMatcher(patterns)
+        cached = set()
+        signatures = {}
+        if self.cache:
+            for playlist in self.playlists:
+                signatures[playlist] = self.cache.signature(playlist)
+                if self.cache.valid(playlist, signatures[playlist], patterns):
+                    cached.add(playlist)
+        stale = [p for p in self.playlists if p not in cached]
+        executor = None
+        if self.workers > 1 and len(stale) > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+            results = executor.map(
+                self.match_playlist,
+                stale,
+                repeat(matcher),
+                chunksize=max(1, len(stale) // (self.workers * 4)),
+            )
+        else:
+            results = (
+                self.match_playlist(playlist, matcher) for playlist in stale
+            )
+        try:
+            for playlist in self.playlists:
+                self.show_message(
+                    f"Searching playlists for {catalogue_names} "
+                    f"catalogue numbers...\n\n{playlist}"
                 )
-        works.sort()
-        works.remove_duplicates()
-        self.write_playlists(catalogue_name, works)
+                if playlist in cached:
+                    # decoded a playlist at a time, so that cached matches
+                    # count against the memory budget as they're added
+                    matched, matches = self.cache.get(playlist, patterns)
+                else:
+                    matched, matches = next(results)
+                    if self.cache:
+                        self.cache.put(
+                            playlist,
+                            signatures[playlist],
+                            patterns,
+                            matched,
+                            matches,
+                        )
+                for value, i, groups in matches:
+                    catalogue = self.Catalogue(value)
+                    works[catalogue].append_groups(
+                        groups, catalogue, *matched[i]
+                    )
+                if self.memory_budget:
+                    self.spill_largest(works, self.memory_budget)
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        return works
+
+    @staticmethod
+    def spill_largest(works, budget):
+        # spills the SpilledWorks holding the most until all of works
+        # together fit in budget, however the works are spread across
+        # catalogues
+        while sum(w.size for w in works.values()) >= budget:
+            max(works.values(), key=attrgetter("size")).spill()
 
     def write_playlists(self, catalogue_name, works):
-        # split list into Kodi size chunks
-        # KODI_MAX_FILE_LENGTH: 1048576
-        chunk_start = 0
-        # TODO size of [playlist], NumberOfEntries, Version,
+        # split works, a PlaylistWorks or SpilledWorks, into Kodi size
+        # chunks as they are read, and return their file names
+        fnames = []
+        labels = {}
+        for chunk in self.chunk_works(works, self.KODI_MAX_FILE_LENGTH):
+            start_label = works.work_label(chunk[0], prefix=True)
+            end_label = works.work_label(chunk[-1])
+            label = f"{start_label} - {end_label}"
+            # the playlists of a split catalogue number share labels
+            labels[label] = labels.get(label, 0) + 1
+            if labels[label] > 1:
+                label = f"{label} ({labels[label]})"
+            fnames.append(f"{label}.pls")
+            self.write_playlist(catalogue_name, chunk, fnames[-1])
+        return fnames
+
+    @classmethod
+    def chunk_works(cls, works, max_length):
+        # yields lists of sorted works, each to be written as a playlist
+        # of at most max_length bytes, sized exactly as pls writes it.
+        # Works with the same catalogue number are packed greedily into
+        # each playlist in turn, which gives the fewest playlists without
+        # splitting a catalogue number across them, unless one has too
+        # many works for a single playlist. Only a playlist's works and
+        # the next catalogue number's are held at a time.
+        chunk = []
         size = 0
-        cn_boundary = (0, works[0][self.Columns.CATALOGUE_NUM])
-        for i in range(0, len(works)):
-            cn_new = works[i][self.Columns.CATALOGUE_NUM]
-            if cn_new > cn_boundary[1]:
-                cn_boundary = (i, cn_new)
-            s = 0
-            # TODO size of playlist relevant cols only
-            for w in works[i]:
-                s += sys.getsizeof(w)
-            if size + s <= self.KODI_MAX_FILE_LENGTH:
-                size += s
-            else:
-                start_label = works.create_work_label(chunk_start, prefix=True)
-                end_label = works.create_work_label(cn_boundary[0] - 1)
-                self.write_playlist(
-                    catalogue_name,
-                    works[chunk_start : cn_boundary[0]],  # noqa: E203
-                    f"{start_label} - {end_label}.pls",
-                )
-                i = cn_boundary[0]
-                chunk_start = i
+        for _, block in groupby(
+            works, key=itemgetter(cls.Columns.CATALOGUE_NUM)
+        ):
+            block = list(block)
+            # entry numbers, and so lengths, depend on the position
+            s = sum(
+                cls.entry_length(w, len(chunk) + k)
+                for k, w in enumerate(block, start=1)
+            )
+            n = len(chunk) + len(block)
+            if chunk and size + s + pls.envelope_length(n) > max_length:
+                # start a playlist and size the works again
+                yield chunk
+                chunk = []
                 size = 0
-        start_label = works.create_work_label(chunk_start, prefix=True)
-        end_label = works.create_work_label(i)
-        self.write_playlist(
-            catalogue_name,
-            works[chunk_start : len(works)],  # noqa: E203
-            f"{start_label} - {end_label}.pls",
+                s = sum(
+                    cls.entry_length(w, k)
+                    for k, w in enumerate(block, start=1)
+                )
+            n = len(chunk) + len(block)
+            if size + s + pls.envelope_length(n) <= max_length:
+                chunk += block
+                size += s
+                continue
+            for w in block:
+                s = cls.entry_length(w, len(chunk) + 1)
+                if (
+                    chunk
+                    and size + s + pls.envelope_length(len(chunk) + 1)
+                    > max_length
+                ):
+                    yield chunk
+                    chunk = []
+                    size = 0
+                    s = cls.entry_length(w, 1)
+                chunk.append(w)
+                size += s
+        if chunk:
+            yield chunk
+
+    @classmethod
+    def plan_chunks(cls, works, max_length):
+        # returns the [(start, end)] ranges of works that chunk_works
+        # yields
+        chunks = []
+        start = 0
+        for chunk in cls.chunk_works(works, max_length):
+            chunks.append((start, start + len(chunk)))
+            start += len(chunk)
+        return chunks
+
+    @classmethod
+    def entry_length(cls, work, n):
+        # bytes taken by a work written as entry n
+        return pls.entry_length(
+            n,
+            work[cls.Columns.FILE],
+            work[cls.Columns.TITLE],
+            work[cls.Columns.LENGTH],
         )
 
     def write_playlist(self, catalogue_name, works, fname):
-        cp = configparser.ConfigParser(interpolation=None)
-        cp.optionxform = lambda option: option
-        cp.add_section("playlist")
-        i = 1
-        for w in works:
-            cp.set("playlist", f"File{i}", w[self.Columns.FILE])
-            cp.set("playlist", f"Title{i}", w[self.Columns.TITLE])
-            cp.set("playlist", f"Length{i}", w[self.Columns.LENGTH])
-            i += 1
-        cp.set("playlist", "NumberOfEntries", f"{i - 1}")
-        cp.set("playlist", "Version", f"{2}")
         fn = f"{self.destination_folder}/{fname}"
-        msg = f"Writing {catalogue_name} catalogue playlist...\n\n{fn}"
-        self.splashscreen.showMessage(
-            msg, Qt.AlignVCenter | Qt.AlignHCenter, Qt.white
+        self.show_message(
+            f"Writing {catalogue_name} catalogue playlist...\n\n{fn}"
+        )
+        pls.write_playlist(
+            fn,
+            (
+                (
+                    w[self.Columns.FILE],
+                    w[self.Columns.TITLE],
+                    w[self.Columns.LENGTH],
+                )
+                for w in works
+            ),
         )
-        QApplication.processEvents()
-        with open(fn, mode="w", encoding="latin-1") as f:
-            cp.write(f, space_around_delimiters=False)
-            # https://bugs.python.org/issue32917
-            # 'ConfigParser writes a superfluous final blank line'
-            # ...which causes kodi to ignore the playlist, thanks!
-            if platform.system() == "Windows":
-                newline_len = 2
-            else:
-                newline_len = 1
-            new_eof = f.tell() - newline_len
-            f.seek(new_eof)
-            f.truncate()
 
-    class PlaylistWorks(list):
-        abbreviations = ["Op.", "BWV.", "K.", "D.", "Hob."]
+    class PlaylistWorks:
+        # A catalogue's works, held as columns rather than a list per
+        # work. Catalogue numbers, suffixes (as ordinals) and pieces are
+        # arrays of integers, labels are interned, and files, broadcast
+        # details and lengths are references to the matched playlist
+        # entries' strings, shared by all catalogues. Works read by
+        # index, iteration or slice are (catalogue number, suffix, piece,
+        # file, title, length) tuples, as Columns, the title being
+        # formatted from the label and details only then.
 
         def __init__(self, key=None):
-            super().__init__()
             if key is None:
-                key = self.Catalogue.OPUS
+                key = PlaylistRecomposer.Catalogue.OPUS
             self.key = key
+            self.numbers = array("q")
+            self.suffixes = array("I")
+            self.pieces = array("q")
+            self.labels = []
+            self.files = []
+            self.titles = []
+            self.lengths = []
+            self.interned = {}
+
+        def __len__(self):
+            return len(self.numbers)
+
+        def __getitem__(self, index):
+            if isinstance(index, slice):
+                return [self[i] for i in range(*index.indices(len(self)))]
+            suffix = self.suffixes[index]
+            return (
+                self.numbers[index],
+                chr(suffix) if suffix else "",
+                self.pieces[index],
+                self.files[index],
+                f"{self.labels[index]} - {self.titles[index]}",
+                self.lengths[index],
+            )
+
+        def __iter__(self):
+            for i in range(len(self)):
+                yield self[i]
 
         def append_regex_matches(self, matches, catalogue, file, title, length):
             for m in matches:
-                value = m.groups()[PlaylistRecomposer.Columns.CATALOGUE_NUM]
-                if catalogue == PlaylistRecomposer.Catalogue.HOBOKEN:
-                    if PlaylistRecomposer.Roman.is_roman(value):
-                        value = PlaylistRecomposer.Roman.to_decimal(value)
-                entry = (
-                    f"{self.abbreviations[catalogue.value]} "
-                    f"{value}"
-                    f"{m.groups()[PlaylistRecomposer.Columns.SUFFIX]}"
-                )
-                piece = m.groups()[PlaylistRecomposer.Columns.PIECE]
-                if piece == "":
-                    piece = "0"
-                else:
-                    entry = f"{entry} No. {piece}"
-                super().append(
-                    [
-                        int(value),
-                        m.groups()[PlaylistRecomposer.Columns.SUFFIX],
-                        int(piece),
-                        file,
-                        f"{entry} - {title}",
-                        length,
-                    ]
-                )
+                self.append_groups(m.groups(), catalogue, file, title, length)
+
+        def append_groups(self, groups, catalogue, file, title, length):
+            # groups are a match's (catalogue number, suffix, piece)
+            value = groups[PlaylistRecomposer.Columns.CATALOGUE_NUM]
+            registry_entry = PlaylistRecomposer.registry[catalogue.value]
+            if registry_entry["numbering"] == "roman":
+                if PlaylistRecomposer.Roman.is_roman(value):
+                    value = PlaylistRecomposer.Roman.to_decimal(value)
+            suffix = groups[PlaylistRecomposer.Columns.SUFFIX]
+            entry = f"{registry_entry['abbreviation']} {value}{suffix}"
+            piece = groups[PlaylistRecomposer.Columns.PIECE]
+            if piece == "":
+                piece = "0"
+            else:
+                entry = f"{entry} No. {piece}"
+            self.append_int("numbers", int(value))
+            self.suffixes.append(ord(suffix) if suffix else 0)
+            self.append_int("pieces", int(piece))
+            self.labels.append(self.interned.setdefault(entry, entry))
+            self.files.append(file)
+            self.titles.append(title)
+            self.lengths.append(length)
+
+        def append_int(self, column, value):
+            # a column too small for the value becomes a list
+            try:
+                getattr(self, column).append(value)
+            except OverflowError:
+                setattr(self, column, list(getattr(self, column)))
+                getattr(self, column).append(value)
+
+        def take(self, indices):
+            # keeps the works at indices, in that order
+            for column in (
+                "numbers",
+                "suffixes",
+                "pieces",
+                "labels",
+                "files",
+                "titles",
+                "lengths",
+            ):
+                values = getattr(self, column)
+                taken = [values[i] for i in indices]
+                if isinstance(values, array):
+                    taken = array(values.typecode, taken)
+                setattr(self, column, taken)
 
         def sort(self):
-            super().sort(
-                key=lambda row: (
-                    row[PlaylistRecomposer.Columns.CATALOGUE_NUM],
-                    row[PlaylistRecomposer.Columns.SUFFIX],
-                    row[PlaylistRecomposer.Columns.PIECE],
-                )
+            # by catalogue number, suffix and piece, combined into one
+            # integer per work, wide enough for the largest of each
+            if not self:
+                return
+            piece_bits = max(max(self.pieces), 0).bit_length()
+            suffix_bits = max(self.suffixes).bit_length()
+            keys = [
+                (n << (suffix_bits + piece_bits)) | (s << piece_bits) | p
+                for n, s, p in zip(self.numbers, self.suffixes, self.pieces)
+            ]
+            self.take(sorted(range(len(self)), key=keys.__getitem__))
+
+        def work_key(self, index, originals=None):
+            # a work's identity, (catalogue number, suffix, piece, file).
+            # With originals, {copy: original} as load_originals returns,
+            # copies of a recording take their original's file.
+            return (
+                self.numbers[index],
+                self.suffixes[index],
+                self.pieces[index],
+                self.original_file(self.files[index], originals),
             )
 
-        def remove_duplicates(self):
-            uniques = list()
-            [uniques.append(item) for item in self if item not in uniques]
-            self[:] = uniques
+        @staticmethod
+        def original_file(file, originals):
+            # a copy's original, else file, as a key
+            if originals:
+                file = file.replace("\\", "/").split("/", 2)[-1]
+                file = originals.get(file, file)
+            return file
+
+        def remove_duplicates(self, originals=None):
+            # keeps the first of each work, in order, so a work found
+            # more than once in the same title or playlists, e.g. as both
+            # K. 525 and KV 525, is listed once
+            seen = set()
+            uniques = []
+            for i in range(len(self)):
+                key = self.work_key(i, originals)
+                if key not in seen:
+                    seen.add(key)
+                    uniques.append(i)
+            if len(uniques) < len(self):
+                self.take(uniques)
 
         def create_work_label(self, index, prefix=False):
+            return self.work_label(self[index], prefix)
+
+        def work_label(self, work, prefix=False):
             if prefix:
-                label = f"{self.abbreviations[self.key.value]} "
+                abbreviation = PlaylistRecomposer.registry[self.key.value][
+                    "abbreviation"
+                ]
+                label = f"{abbreviation} "
             else:
                 label = ""
             label += (
-                f"{self[index][PlaylistRecomposer.Columns.CATALOGUE_NUM]}"
-                f"{self[index][PlaylistRecomposer.Columns.SUFFIX]}"
+                f"{work[PlaylistRecomposer.Columns.CATALOGUE_NUM]}"
+                f"{work[PlaylistRecomposer.Columns.SUFFIX]}"
             )
-            piece = self[index][PlaylistRecomposer.Columns.PIECE]
+            piece = work[PlaylistRecomposer.Columns.PIECE]
             if piece == 0:
                 return label
             else:
                 return f"{label} No. {piece}"
 
-    class FolderDialog(QFileDialog):
-        def __init__(self, title, rootdir=None, catalogue_chooser=None):
-            QFileDialog.__init__(self)
-            if QApplication.platformName() == "cocoa":
-                self.setOption(QFileDialog.DontUseNativeDialog)
-            self.setWindowTitle(title)
-            self.setFileMode(QFileDialog.Directory)
-            self.show()
-            if rootdir:
-                self.setDirectory(rootdir)
-            if catalogue_chooser:
-                self.catalogue_chooser = self.CatalogueGroupBox()
-                self.catalogue_chooser.setMinimumWidth(122)
-                self.modify()
-
-        def modify(self):
-            splitter = self.findChild(QSplitter, None)
-            sidebar = splitter.findChild(QListView, "sidebar")
-            listview = splitter.findChild(QListView, "listView")
-            filename_label = self.findChild(QLabel, "fileNameLabel")
-            # TODO set a theme appropriate
-            # border colour, as in kodi-remote
-            listview.setStyleSheet(
-                "border: 1px solid silver; border-radius: 4px"
+    class SpilledWorks:
+        # A catalogue's works sorted within a memory budget, for
+        # libraries whose works don't fit in memory. Works are gathered
+        # in a PlaylistWorks until its estimated size reaches the
+        # budget, then sorted and spilled as a run to a file in a
+        # temporary folder. Iteration k-way merges the runs, removing
+        # duplicates as it goes, and yields the works in the same order
+        # as a sorted PlaylistWorks without duplicates: ties are taken
+        # from the earlier run, as a stable sort would, and duplicates
+        # share their catalogue number, suffix and piece, so only the
+        # files of one of those are held at a time. Runs are only open
+        # while they are merged, and at most fan_in at once: beyond
+        # that, adjacent runs are first merged fan_in at a time into
+        # larger runs, in as many passes as it takes.
+        # estimated bytes per work, besides its strings
+        overhead = 200
+        fan_in = 64
+
+        def __init__(self, key, budget):
+            self.key = key
+            self.budget = budget
+            self.works = PlaylistRecomposer.PlaylistWorks(key)
+            self.size = 0
+            self.order = itemgetter(
+                PlaylistRecomposer.Columns.CATALOGUE_NUM,
+                PlaylistRecomposer.Columns.SUFFIX,
+                PlaylistRecomposer.Columns.PIECE,
             )
-            filename_label.setFixedWidth(120)
-            sidebar.hide()
-            children = splitter.findChildren(QSplitterHandle, None)
-            for c in children:
-                c.setDisabled(True)
-            splitter.insertWidget(0, self.catalogue_chooser)
-
-        class CatalogueGroupBox(QGroupBox):
-
-            def __init__(self):
-                super().__init__()
-                self.chkbox_catalogues = {
-                    "checkBoxOpus": PlaylistRecomposer.Catalogue.OPUS,
-                    "checkBoxBWV": PlaylistRecomposer.Catalogue.BWV,
-                    "checkBoxKoechel": PlaylistRecomposer.Catalogue.KOECHEL,
-                    "checkBoxDeutsch": PlaylistRecomposer.Catalogue.DEUTSCH,
-                    "checkBoxHoboken": PlaylistRecomposer.Catalogue.HOBOKEN,
-                }
-                self.setObjectName("checkGroupBox")
-                self.setCheckable(True)
-                self.verticalLayout = QVBoxLayout(self)
-                self.verticalLayout.setObjectName("verticalLayout")
-                self.checkBoxOpus = QCheckBox(self)
-                self.checkBoxOpus.setObjectName("checkBoxOpus")
-                self.checkBoxOpus.setChecked(True)
-                self.verticalLayout.addWidget(self.checkBoxOpus)
-                self.checkBoxBWV = QCheckBox(self)
-                self.checkBoxBWV.setObjectName("checkBoxBWV")
-                self.checkBoxBWV.setChecked(True)
-                self.verticalLayout.addWidget(self.checkBoxBWV)
-                self.checkBoxKoechel = QCheckBox(self)
-                self.checkBoxKoechel.setObjectName("checkBoxKoechel")
-                self.checkBoxKoechel.setChecked(True)
-                self.verticalLayout.addWidget(self.checkBoxKoechel)
-                self.checkBoxDeutsch = QCheckBox(self)
-                self.checkBoxDeutsch.setObjectName("checkBoxDeutsch")
-                self.checkBoxDeutsch.setChecked(True)
-                self.verticalLayout.addWidget(self.checkBoxDeutsch)
-                self.checkBoxHoboken = QCheckBox(self)
-                self.checkBoxHoboken.setObjectName("checkBoxHoboken")
-                self.checkBoxHoboken.setChecked(True)
-                self.verticalLayout.addWidget(self.checkBoxHoboken)
-                self.setTitle("Select All")
-                self.checkBoxOpus.setText("Opus")
-                self.checkBoxBWV.setText("BWV")
-                self.checkBoxKoechel.setText("Köchel")
-                self.checkBoxDeutsch.setText("Deutsch")
-                self.checkBoxHoboken.setText("Hoboken")
-                self.toggled.connect(self.toggle_all)
-                for box in self.findChildren(QCheckBox):
-                    box.stateChanged.connect(self.manage_states)
-
-            def toggle_all(self, state):
-                for box in self.sender().findChildren(QCheckBox):
-                    box.setChecked(state)
-                    box.setEnabled(True)
-
-            def manage_states(self):
-                checked = []
-                for c in self.findChildren(QCheckBox):
-                    if c.isChecked():
-                        checked.append(c)
-                if len(checked) < len(PlaylistRecomposer.Catalogue):
-                    self.setChecked(False)
-                    for box in checked:
-                        box.setChecked(True)
-                else:
-                    self.setChecked(True)
-
-            def get_selections(self):
-                selected_catalogues = []
-                for box in self.findChildren(QCheckBox):
-                    if box.isChecked():
-                        selected_catalogues.append(
-                            self.chkbox_catalogues[box.objectName()]
+            self.folder = None
+            # run file paths, oldest first
+            self.runs = []
+            self.files = 0
+            self.spills = 0
+            self.originals = None
+            self.deduplicate = False
+
+        def __bool__(self):
+            return bool(self.runs or self.works)
+
+        def append_groups(self, groups, catalogue, file, title, length):
+            self.works.append_groups(groups, catalogue, file, title, length)
+            self.size += self.overhead + len(file) + len(title) + len(length)
+            if self.size >= self.budget:
+                self.spill()
+
+        def write_run(self, works):
+            if self.folder is None:
+                self.folder = tempfile.TemporaryDirectory()
+            path = os.path.join(self.folder.name, f"{self.files}.run")
+            self.files += 1
+            with open(path, mode="wb") as run:
+                for work in works:
+                    pickle.dump(work, run, pickle.HIGHEST_PROTOCOL)
+            return path
+
+        def spill(self):
+            self.works.sort()
+            self.runs.append(self.write_run(self.works))
+            self.spills += 1
+            self.works = PlaylistRecomposer.PlaylistWorks(self.key)
+            self.size = 0
+
+        def sort(self):
+            self.works.sort()
+
+        def remove_duplicates(self, originals=None):
+            self.deduplicate = True
+            self.originals = originals
+
+        def read_run(self, path):
+            with open(path, mode="rb") as run:
+                while True:
+                    try:
+                        yield pickle.load(run)
+                    except EOFError:
+                        return
+
+        def merge_runs(self):
+            # merges adjacent runs, so that ties keep their order
+            while len(self.runs) > self.fan_in:
+                runs = self.runs
+                self.runs = []
+                for i in range(0, len(runs), self.fan_in):
+                    group = runs[i : i + self.fan_in]
+                    if len(group) > 1:
+                        self.runs.append(
+                            self.write_run(
+                                heapq.merge(
+                                    *(self.read_run(run) for run in group),
+                                    key=self.order,
+                                )
+                            )
                         )
-                return selected_catalogues
+                        for run in group:
+                            os.remove(run)
+                    else:
+                        self.runs += group
+
+        def __iter__(self):
+            self.merge_runs()
+            works = heapq.merge(
+                *(self.read_run(run) for run in self.runs),
+                iter(self.works),
+                key=self.order,
+            )
+            if not self.deduplicate:
+                yield from works
+                return
+            for _, same in groupby(works, key=self.order):
+                files = set()
+                for work in same:
+                    file = PlaylistRecomposer.PlaylistWorks.original_file(
+                        work[PlaylistRecomposer.Columns.FILE], self.originals
+                    )
+                    if file not in files:
+                        files.add(file)
+                        yield work
+
+        def work_label(self, work, prefix=False):
+            return self.works.work_label(work, prefix)
+
+        def close(self):
+            if self.folder:
+                self.folder.cleanup()
+                self.folder = None
+            self.runs = []
+
+    # the file pickers' class, FolderDialog, once run_gui has imported Qt
+    FolderDialog = None
+
+    @staticmethod
+    def folder_dialog():
+        class FolderDialog(QFileDialog):
+            def __init__(self, title, rootdir=None, catalogue_chooser=None):
+                QFileDialog.__init__(self)
+                if QApplication.platformName() == "cocoa":
+                    self.setOption(QFileDialog.DontUseNativeDialog)
+                self.setWindowTitle(title)
+                self.setFileMode(QFileDialog.Directory)
+                self.show()
+                if rootdir:
+                    self.setDirectory(rootdir)
+                if catalogue_chooser:
+                    self.catalogue_chooser = self.CatalogueGroupBox()
+                    self.catalogue_chooser.setMinimumWidth(122)
+                    self.modify()
+
+            def modify(self):
+                splitter = self.findChild(QSplitter, None)
+                sidebar = splitter.findChild(QListView, "sidebar")
+                listview = splitter.findChild(QListView, "listView")
+                filename_label = self.findChild(QLabel, "fileNameLabel")
+                # TODO set a theme appropriate
+                # border colour, as in kodi-remote
+                listview.setStyleSheet(
+                    "border: 1px solid silver; border-radius: 4px"
+                )
+                filename_label.setFixedWidth(120)
+                sidebar.hide()
+                children = splitter.findChildren(QSplitterHandle, None)
+                for c in children:
+                    c.setDisabled(True)
+                splitter.insertWidget(0, self.catalogue_chooser)
+
+            class CatalogueGroupBox(QGroupBox):
+
+                def __init__(self):
+                    super().__init__()
+                    self.chkbox_catalogues = {}
+                    self.setObjectName("checkGroupBox")
+                    self.setCheckable(True)
+                    self.verticalLayout = QVBoxLayout(self)
+                    self.verticalLayout.setObjectName("verticalLayout")
+                    # a check box per registry entry
+                    for catalogue in PlaylistRecomposer.Catalogue:
+                        entry = PlaylistRecomposer.registry[catalogue.value]
+                        box = QCheckBox(self)
+                        box.setObjectName(f"checkBox{catalogue.value}")
+                        box.setChecked(True)
+                        box.setText(entry["name"])
+                        if "composer" in entry:
+                            box.setToolTip(entry["composer"])
+                        self.verticalLayout.addWidget(box)
+                        self.chkbox_catalogues[box.objectName()] = catalogue
+                    self.setTitle("Select All")
+                    self.toggled.connect(self.toggle_all)
+                    for box in self.findChildren(QCheckBox):
+                        box.stateChanged.connect(self.manage_states)
+
+                def toggle_all(self, state):
+                    for box in self.sender().findChildren(QCheckBox):
+                        box.setChecked(state)
+                        box.setEnabled(True)
+
+                def manage_states(self):
+                    checked = []
+                    for c in self.findChildren(QCheckBox):
+                        if c.isChecked():
+                            checked.append(c)
+                    if len(checked) < len(PlaylistRecomposer.Catalogue):
+                        self.setChecked(False)
+                        for box in checked:
+                            box.setChecked(True)
+                    else:
+                        self.setChecked(True)
+
+                def get_selections(self):
+                    selected_catalogues = []
+                    for box in self.findChildren(QCheckBox):
+                        if box.isChecked():
+                            selected_catalogues.append(
+                                self.chkbox_catalogues[box.objectName()]
+                            )
+                    return selected_catalogues
+
+        return FolderDialog
+
+    class CatalogueRegistry:
+        # The catalogues searched for, as listed in catalogues.json
+        # alongside this script, so that one is added without changing
+        # any code. Each entry gives a catalogue's key, name (and
+        # composer), the abbreviation its works are labelled with and
+        # its grammar, from which CatalogueParser and select_regex are
+        # built: the prefixes its numbers are written with, whether they
+        # may be repeated (true by default) or must be separated from
+        # the number (false by default), whether opus posthumous may
+        # come between them (false by default), the numbering, arabic
+        # or roman (or arabic), the suffix letters, and the separators
+        # and markers, e.g. "No", before a piece number.
+        file_name = "catalogues.json"
+        version = 1
+
+        @classmethod
+        def load(cls, path=None):
+            # returns {key: entry}, in file order, and the file's digest
+            if path is None:
+                path = os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)), cls.file_name
+                )
+            with open(path, mode="rb") as f:
+                data = f.read()
+            registry = json.loads(data)
+            if registry.get("version") != cls.version:
+                raise ValueError(f"{path}: unsupported version")
+            return (
+                {entry["key"]: entry for entry in registry["catalogues"]},
+                hashlib.sha256(data).hexdigest(),
+            )
 
-    class Catalogue(Enum):
-        OPUS = 0
-        BWV = 1
-        KOECHEL = 2
-        DEUTSCH = 3
-        HOBOKEN = 4
+    # {key: entry} and its digest, which cached matches depend on
+    registry, registry_digest = CatalogueRegistry.load()
+    # a member per registry entry, whose value is its key, named so
+    # that members can be pickled for the worker processes
+    Catalogue = Enum(
+        "Catalogue",
+        [(key, key) for key in registry],
+        module=__name__,
+        qualname="PlaylistRecomposer.Catalogue",
+    )
 
     class Columns(IntEnum):
         CATALOGUE_NUM = 0
@@ -478,25 +932,494 @@ class PlaylistRecomposer:
         def is_roman(value):
             return re.search(r"[MDCLXVI]", value, re.IGNORECASE)
 
+    class CatalogueParser:
+        # Single pass equivalent of a select_regex pattern, whose nested
+        # quantifiers backtrack badly on long, punctuation heavy titles.
+        # Each prefix is read once, so that matching is linear in the
+        # title length. findall returns what the pattern's findall
+        # would, [(catalogue number, suffix, piece)], roman numbers
+        # being left as Roman numerals for PlaylistRecomposer.Roman.
+        # CatalogueMatcher matches titles against several at once.
 
-if __name__ == "__main__":
+        # folding as re.IGNORECASE does, one character for one
+        unfolded = "İıſ"
+        folds = str.maketrans(unfolded, "iis")
+        # to be incremented whenever what findall finds changes, so that
+        # cached matches are matched again
+        version = 1
+        # matches this catalogue alone, for findall
+        matcher = None
+
+        def __init__(self, key):
+            self.key = key
+            entry = PlaylistRecomposer.registry[key.value]
+            # the longest first, as each is read whole
+            self.prefixes = tuple(
+                sorted(entry["prefixes"], key=len, reverse=True)
+            )
+            self.repeated = entry.get("repeated", True)
+            self.separated = entry.get("separated", False)
+            self.posthumous = entry.get("posthumous", False)
+            self.roman = entry["numbering"] == "roman"
+            self.suffixes = frozenset(entry["suffixes"])
+            self.piece_separators = entry["piece_separators"]
+            self.piece_markers = tuple(entry["piece_markers"])
+
+        @classmethod
+        def fold(cls, title):
+            # the title lower cased, character for character
+            if not title.isascii() and any(c in title for c in cls.unfolded):
+                return title.translate(cls.folds).lower()
+            return title.lower()
+
+        def findall(self, title):
+            if self.matcher is None:
+                self.matcher = PlaylistRecomposer.CatalogueMatcher(
+                    {self.key.value: self}
+                )
+            return [groups for _, groups in self.matcher.findall(title)]
+
+        def match(self, title, folded, i, memo):
+            # returns the end and groups of a match at i, or (-1, None).
+            # memo is the first digit, start of the separators before it
+            # and first newline found by the last opus posthumous scan.
+            n = len(title)
+            # of the ends of repeated prefixes, e.g. (?:op|opus)+, only
+            # the last can be followed by a number
+            while True:
+                for prefix in self.prefixes:
+                    if folded.startswith(prefix, i):
+                        i += len(prefix)
+                        break
+                else:
+                    break
+                if not self.repeated:
+                    break
+            if self.posthumous:
+                i = self.opus(title, folded, i, memo)
+            else:
+                j = self.skip(title, i, ".")
+                i = -1 if self.separated and j == i else j
+            if i < 0:
+                return -1, None
+            j = i
+            if self.roman:
+                while j < n and folded[j] in "xvi":
+                    j += 1
+            if j == i:
+                while j < n and title[j].isdecimal():
+                    j += 1
+                if j == i:
+                    return -1, None
+            number = title[i:j]
+            suffix = ""
+            if j < n and folded[j] in self.suffixes:
+                suffix = title[j]
+                j += 1
+            j = self.skip(title, j, self.piece_separators)
+            while True:
+                for marker in self.piece_markers:
+                    if folded.startswith(marker, j):
+                        j += len(marker)
+                        break
+                else:
+                    break
+            j = self.skip(title, j, ".")
+            i = j
+            while j < n and title[j].isdecimal():
+                j += 1
+            return j, (number, suffix, title[i:j])
+
+        def opus(self, title, folded, i, memo):
+            # returns where the number after the prefixes starts, or -1
+            i = self.skip(title, i, ".")
+            if not folded.startswith("posth", i):
+                return self.skip(title, i, ".,")
+            # (?:posth.*?)* reaches the first digit after it, unless
+            # . would have to match a newline before its separators
+            i += 5
+            if memo[0] < i:
+                d = i
+                while d < len(title) and not title[d].isdecimal():
+                    d += 1
+                s = d
+                while s > 0 and (
+                    title[s - 1] in ".," or title[s - 1].isspace()
+                ):
+                    s -= 1
+                memo[0], memo[1] = d, s
+            if memo[2] < i:
+                memo[2] = title.find("\n", i)
+                if memo[2] < 0:
+                    memo[2] = len(title)
+            if memo[0] == len(title) or memo[2] < max(i, memo[1]):
+                return -1
+            return memo[0]
+
+        @staticmethod
+        def skip(title, i, separators):
+            # skips whitespace and separators
+            while i < len(title) and (
+                title[i] in separators or title[i].isspace()
+            ):
+                i += 1
+            return i
+
+    class CatalogueMatcher:
+        # CatalogueParsers, {catalogue value: parser}, compiled into one
+        # matcher, so that each title is scanned once for the prefixes
+        # of all of them, however many catalogues are searched for.
+        # Each parser resumes after its own last match, so that findall
+        # returns, as [(catalogue value, groups)] in title order, what
+        # the parsers' findall would, together.
+
+        def __init__(self, parsers):
+            self.parsers = parsers
+            prefixes = sorted(
+                {p for parser in parsers.values() for p in parser.prefixes},
+                key=len,
+                reverse=True,
+            )
+            # at the start of a word, the longest first. Folding doesn't
+            # change whether a character is part of a word.
+            self.candidates = re.compile(
+                r"(?<!\w)(?:" + "|".join(re.escape(p) for p in prefixes) + ")"
+            )
+            # the parsers that can match where a prefix is the longest
+            # found, those with it or a prefix of it
+            self.by_prefix = {
+                prefix: [
+                    (value, parser)
+                    for value, parser in parsers.items()
+                    if prefix.startswith(parser.prefixes)
+                ]
+                for prefix in prefixes
+            }
+
+        def findall(self, title):
+            folded = PlaylistRecomposer.CatalogueParser.fold(title)
+            resume = dict.fromkeys(self.parsers, 0)
+            memos = {}
+            found = []
+            for m in self.candidates.finditer(folded):
+                i = m.start()
+                for value, parser in self.by_prefix[m.group()]:
+                    if i < resume[value]:
+                        continue
+                    end, groups = parser.match(
+                        title, folded, i, memos.setdefault(value, [-1, -1, -1])
+                    )
+                    if end < 0:
+                        resume[value] = i + 1
+                    else:
+                        resume[value] = end
+                        found.append((value, groups))
+            return found
+
+    class MatchCache:
+        # Catalogue matches per playlist, keyed by playlist path, so that
+        # only new or changed playlists are read and matched again. An
+        # entry is only valid while the playlist's (size, mtime), the
+        # CatalogueParser version and the catalogue registry are
+        # unchanged, and holds the matched entries and, per catalogue it
+        # was matched against, the matches as match_playlist returns them.
+        # version 2: playlists' last entries are matched
+        version = 2
+
+        def __init__(self, path=None):
+            if path is None:
+                path = self.default_path()
+            self.path = path
+            self.hits = 0
+            self.misses = 0
+            self.entries = {}
+            self.dirty = False
+            self.load()
+
+        @staticmethod
+        def default_path():
+            if platform.system() == "Windows":
+                cache_dir = os.environ.get(
+                    "LOCALAPPDATA", os.path.expanduser("~")
+                )
+            else:
+                cache_dir = os.environ.get(
+                    "XDG_CACHE_HOME", os.path.expanduser("~/.cache")
+                )
+            return os.path.join(
+                cache_dir, "kodi-classical", "playlist-recomposer-cache.json"
+            )
+
+        @staticmethod
+        def signature(playlist):
+            st = os.stat(playlist)
+            return [
+                st.st_size,
+                st.st_mtime_ns,
+                PlaylistRecomposer.CatalogueParser.version,
+                PlaylistRecomposer.registry_digest,
+            ]
+
+        def load(self):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                return
+            if cache.get("version") == self.version:
+                self.entries = cache["entries"]
+
+        def save(self):
+            if not self.dirty:
+                return
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self.path)), exist_ok=True
+            )
+            tmp = f"{self.path}.tmp"
+            with open(tmp, mode="w", encoding="utf-8") as f:
+                # dumps, unlike dump, encodes in C
+                f.write(
+                    json.dumps(
+                        {"version": self.version, "entries": self.entries},
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                    )
+                )
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+        def valid(self, playlist, signature, values):
+            # whether the playlist has matches for the catalogue values,
+            # or must be matched again
+            entry = self.entries.get(playlist)
+            if (
+                not entry
+                or entry["signature"] != signature
+                or any(f"{v}" not in entry["matches"] for v in values)
+            ):
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+        def get(self, playlist, values):
+            # returns (matched, matches) for the catalogue values of a
+            # valid playlist
+            entry = self.entries[playlist]
+            matched = {
+                int(i): tuple(record) for i, record in entry["matched"].items()
+            }
+            matches = [
+                (v, i, tuple(groups))
+                for v in values
+                for i, *groups in entry["matches"][f"{v}"]
+            ]
+            return matched, matches
+
+        def put(self, playlist, signature, values, matched, matches):
+            # matches for other catalogues stay valid while the
+            # playlist is unchanged
+            entry = self.entries.get(playlist)
+            if not entry or entry["signature"] != signature:
+                entry = self.entries[playlist] = {
+                    "signature": signature,
+                    "matched": {},
+                    "matches": {},
+                }
+            for v in values:
+                entry["matches"][f"{v}"] = []
+            for v, i, groups in matches:
+                entry["matched"][f"{i}"] = list(matched[i])
+                entry["matches"][f"{v}"].append([i, *groups])
+            self.dirty = True
+
+        def prune(self, playlists):
+            # forgets playlists no longer in the searched folders
+            folders = {os.path.dirname(p) for p in playlists}
+            playlists = set(playlists)
+            for p in [
+                p
+                for p in self.entries
+                if os.path.dirname(p) in folders and p not in playlists
+            ]:
+                del self.entries[p]
+                self.dirty = True
+
+        def invalidate(self):
+            if self.entries:
+                self.entries = {}
+                self.dirty = True
+
+        def stats(self):
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+            }
+
+
+def run_gui(root, options):
+    # Qt is only imported when the file pickers are actually used, as
+    # module globals, for PlaylistRecomposer and its FolderDialog
+    global Qt, QPixmap, QApplication, QCheckBox, QFileDialog, QGroupBox
+    global QLabel, QListView, QMessageBox, QSplashScreen, QSplitter
+    global QSplitterHandle, QVBoxLayout
+    from PySide6.QtCore import Qt
+    from PySide6.QtGui import QPixmap
+    from PySide6.QtWidgets import (
+        QApplication,
+        QCheckBox,
+        QFileDialog,
+        QGroupBox,
+        QLabel,
+        QListView,
+        QMessageBox,
+        QSplashScreen,
+        QSplitter,
+        QSplitterHandle,
+        QVBoxLayout,
+    )
+
+    PlaylistRecomposer.FolderDialog = PlaylistRecomposer.folder_dialog()
     QApplication()
-    if len(sys.argv) > 1:
-        rootdir = sys.argv[1]
+    return PlaylistRecomposer(root, **options)
+
+
+if __name__ == "__main__":
+    # for the worker pool in frozen releases
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(
+        "playlist-recomposer",
+        description="Generate catalogue playlists from .pls playlists.",
+    )
+    parser.add_argument(
+        "root",
+        nargs="?",
+        default=os.path.expanduser("~"),
+        help="root folder for the file pickers",
+    )
+    parser.add_argument(
+        "-p",
+        "--playlists",
+        help="folder of playlists to search, e.g. playlist-generator's "
+        "destination folder (headless)",
+    )
+    parser.add_argument(
+        "-d",
+        "--destination",
+        help="destination folder for catalogue playlists, which must share "
+        "the playlists folder's parent (headless)",
+    )
+    # listed from the registry, so that catalogues added to it are too
+    catalogues = ", ".join(
+        f"{key.lower()} ({entry['composer']})"
+        if "composer" in entry
+        else key.lower()
+        for key, entry in PlaylistRecomposer.registry.items()
+    )
+    parser.add_argument(
+        "-c",
+        "--catalogues",
+        nargs="+",
+        choices=[c.name.lower() for c in PlaylistRecomposer.Catalogue]
+        + ["all"],
+        metavar="CATALOGUE",
+        help=f"catalogues to search playlists for, of {catalogues}, as "
+        f"listed in {PlaylistRecomposer.CatalogueRegistry.file_name}, or "
+        "all (headless)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of processes matching playlists (default: cpu count)",
+    )
+    parser.add_argument(
+        "--cache-file",
+        help="match cache file "
+        f"(default: {PlaylistRecomposer.MatchCache.default_path()})",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't use the match cache"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="forget all cached matches before searching playlists",
+    )
+    parser.add_argument(
+        "--merge-copies",
+        action="store_true",
+        help="list copies of a recording, as found by playlist-generator's "
+        "--find-duplicates, once",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="megabytes of works to sort in memory, beyond which they are "
+        "sorted in runs spilled to temporary files (default: no limit)",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="don't report progress"
+    )
+    args = parser.parse_args()
+    cache = None
+    if not args.no_cache:
+        cache = PlaylistRecomposer.MatchCache(args.cache_file)
+        if args.clear_cache:
+            cache.invalidate()
+    options = {
+        "workers": args.workers,
+        "cache": cache,
+        "merge_copies": args.merge_copies,
+        "memory_budget": (
+            args.memory_budget * 1048576 if args.memory_budget else None
+        ),
+    }
+    headless = bool(args.playlists or args.destination)
+    if headless:
+        if args.catalogues and "all" in args.catalogues:
+            catalogues = list(PlaylistRecomposer.Catalogue)
+        else:
+            catalogues = [
+                PlaylistRecomposer.Catalogue[c.upper()]
+                for c in dict.fromkeys(args.catalogues or [])
+            ]
+        # forward slashes throughout, as returned by the Qt file pickers
+        playlists_folder, destination_folder = (
+            os.path.abspath(f).replace(os.sep, "/") if f else None
+            for f in (args.playlists, args.destination)
+        )
+        pr = PlaylistRecomposer(
+            args.root,
+            playlists_folder=playlists_folder,
+            destination_folder=destination_folder,
+            catalogues=catalogues,
+            verbose=not args.quiet,
+            **options,
+        )
+    elif importlib.util.find_spec("PySide6"):
+        pr = run_gui(args.root, options)
     else:
-        rootdir = os.path.expanduser("~")
-    pr = PlaylistRecomposer(rootdir)
+        parser.error(
+            "PySide6 is needed for the file pickers, "
+            "else give --playlists, --destination and --catalogues"
+        )
     rc = pr.return_code
     if rc:
         if rc in (1, 3):
-            err_msg = (
-                "\nCannot continue unless a folder is chosen\t\n"
-            )
+            if headless:
+                err_msg = "\nCannot continue unless a folder is given\t\n"
+            else:
+                err_msg = "\nCannot continue unless a folder is chosen\t\n"
             exit_type = "Aborting"
         elif rc == 2:
-            err_msg = (
-                "\nCannot continue unless catalogues are chosen\t\n"
-            )
+            if headless:
+                err_msg = "\nCannot continue unless catalogues are given\t\n"
+            else:
+                err_msg = "\nCannot continue unless catalogues are chosen\t\n"
             exit_type = "Aborting"
         elif rc == 4:
             err_msg = (
@@ -519,6 +1442,12 @@ if __name__ == "__main__":
                 "No playlists in chosen search folder.\t\n"
             )
             exit_type = "Aborting"
-        QMessageBox(
-            QMessageBox.Critical, f"Playlist Generator - {exit_type}", err_msg
-        ).exec()
+        if headless:
+            print(f"{exit_type}: {' '.join(err_msg.split())}", file=sys.stderr)
+        else:
+            QMessageBox(
+                QMessageBox.Critical,
+                f"Playlist Generator - {exit_type}",
+                err_msg,
+            ).exec()
+    sys.exit(rc)